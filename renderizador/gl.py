@@ -11,7 +11,9 @@ Disciplina: Computação Gráfica
 Data: <DATA DE INÍCIO DA IMPLEMENTAÇÃO>
 """
  
+import os           # Para contar os núcleos da CPU
 import time         # Para operações com tempo
+from concurrent.futures import ThreadPoolExecutor  # Para rasterizar tiles em paralelo
 import gpu          # Simula os recursos de uma GPU
 import math         # Funções matemáticas
 import numpy as np  # Biblioteca do Numpy
@@ -24,14 +26,63 @@ class GL:
     near = 0.01   # plano de corte próximo
     far = 1000    # plano de corte distante
     matrizes = {'transform_in': [np.identity(4)], 'viewpoint': np.identity(4), 'perspective': np.identity(4)}
-    current_texture = None
-    # Buffers para supersampling e Z-buffer
+    current_texture = None  # cadeia de mipmaps da textura atual
+    texture_params = None   # referência da textura atual, com os parâmetros de amostragem
+    texture_filter = "NEAREST_PIXEL"  # Filtro do X3D usado quando é pedido o padrão (DEFAULT)
+    # Buffer para supersampling (a profundidade fica no Framebuffer da GPU)
     super_buffer = None
-    z_buffer = None
     supersampling_factor = 2  # Fator de supersampling
+    rasterizacao = "vetorizada"  # "vetorizada" (NumPy) ou "escalar" (referência pixel a pixel)
+    resolve_filter = "box"  # Filtro do resolve do supersampling: "box" ou "tent"
+
+    # Modo por tiles: triângulos são acumulados no quadro e rasterizados em paralelo no flush
+    tiled = False
+    tile_size = 64  # lado de cada tile em pixels do super buffer
+    num_threads = os.cpu_count()
+    fila_triangulos = []
+    executor = None  # pool de threads dos tiles, criado uma vez e reaproveitado
+    executor_threads = 0  # num_threads com que o pool foi criado
  
     # Controle de cores por vértice
     colorPerVertex = False
+
+    # Montagem de primitivas: descarte de faces de trás (honrando solid e ccw) e
+    # contagem, por quadro, dos triângulos descartados em cada teste
+    backface_culling = True
+    estatisticas = {'triangulos': 0, 'fora': 0, 'recortados': 0, 'costas': 0, 'subarvores': 0}
+    mostra_estatisticas = False  # imprime as estatísticas ao fim de cada quadro (--stats)
+
+    # Tesselação das primitivas (Box, Sphere, Cone, Cylinder), guardada por
+    # (primitiva, parâmetros, nível de detalhe); o nível sai do tamanho projetado na tela
+    malhas = {}
+    lod_segmentos = 8  # segmentos ao redor do eixo no nível 0, dobrando a cada nível
+    lod_niveis = 5     # níveis de detalhe (8, 16, 32, 64 e 128 segmentos)
+    lod_aresta = 8     # comprimento desejado, em pixels, de cada aresta do contorno
+
+    # Iluminação: luzes do quadro (headlight, DirectionalLight e PointLight) já no sistema
+    # da câmera, e o sombreamento "gouraud" (por vértice) ou "phong" (por fragmento)
+    sombreamento = "phong"
+    luzes = []
+    arranjo_luzes = None  # as mesmas luzes em matrizes, montadas uma vez por quadro
+
+    # Sombreamento adiado (deferred): a rasterização das geometrias iluminadas e opacas só
+    # grava albedo, normal e material no G-buffer (canais extras do Framebuffer, ao lado da
+    # profundidade) e um único passo de tela inteira ilumina cada amostra visível uma vez.
+    # As transparências são rasterizadas depois desse passo, por cima do resultado.
+    deferred = False
+    materiais = [None]  # materiais do quadro; o identificador 0 marca amostras já coloridas
+    ids_materiais = {}  # identificador de cada material já visto no quadro
+    fila_transparentes = []
+    pixels_por_lote = 65536  # amostras iluminadas por vez no passo de tela inteira
+
+    # Culling de luzes por tiles: cada PointLight só ilumina dentro do seu raio, então a
+    # esfera de influência é projetada na tela e cada tile (ou triângulo, no sombreamento
+    # por fragmento) só avalia as luzes cujo retângulo projetado o alcança
+    culling_luzes = True
+
+    # Névoa do quadro (visibilityRange já no sistema da câmera, cor e fogType), aplicada no
+    # flush em um único passo sobre o quadro inteiro, com a distância tirada da profundidade
+    nevoa = None
  
     @staticmethod
     def setup(width, height, near=0.01, far=1000):
@@ -41,11 +92,10 @@ class GL:
         GL.near = near
         GL.far = far
  
-        # Inicializa o super buffer e o Z-buffer com o fator de supersampling
+        # Inicializa o super buffer com o fator de supersampling
         GL.super_width = GL.width * GL.supersampling_factor
         GL.super_height = GL.height * GL.supersampling_factor
         GL.super_buffer = np.zeros((GL.super_height, GL.super_width, 3), dtype=np.uint8)
-        GL.z_buffer = np.full((GL.super_height, GL.super_width), 1.0)
 
     def compute_barycentric_coordinates(tri, x, y):
         x1, y1 = tri[0], tri[1]
@@ -61,31 +111,71 @@ class GL:
 
  
     @staticmethod
-    def downsample():
-        """Função para realizar o downsampling do super_buffer para o tamanho da tela."""
- 
+    def clear_buffers():
+        """Apaga o super buffer e as estatísticas no início de cada quadro."""
+        GL.super_buffer[:] = 0
+        GL.estatisticas = dict.fromkeys(GL.estatisticas, 0)
+        GL.luzes = []
+        GL.arranjo_luzes = None
+        GL.materiais = [None]
+        GL.ids_materiais = {}
+        GL.nevoa = None
+
+    @staticmethod
+    def imprime_estatisticas():
+        """Imprime no terminal as contagens de descarte e recorte do quadro."""
+        e = GL.estatisticas
+        print(f"Quadro: {e['triangulos']} triângulos, {e['fora']} fora do volume de visão, "
+              f"{e['recortados']} recortados no plano próximo, {e['costas']} de costas, "
+              f"{e['subarvores']} subárvores descartadas")
+
+    @staticmethod
+    def resolve():
+        """Resolve o super_buffer para o tamanho da tela, uma única vez por quadro."""
         factor = GL.supersampling_factor
-        for y in range(GL.height):
-            for x in range(GL.width):
-                # Média das cores do super buffer
-                super_y = y * factor
-                super_x = x * factor
-                region = GL.super_buffer[super_y:super_y + factor, super_x:super_x + factor]
-                color = np.mean(region, axis=(0, 1)).astype(np.uint8)
-                # Desenha o pixel na tela
-                gpu.GPU.draw_pixel([x, y], gpu.GPU.RGB8, color.tolist())
- 
+
+        if GL.resolve_filter == "tent":
+            cores = GL.tent_filter(GL.super_buffer.astype(np.float64), factor)
+        else:
+            # Filtro caixa: média de cada bloco factor x factor
+            blocos = GL.super_buffer.reshape(GL.height, factor, GL.width, factor, 3)
+            cores = blocos.mean(axis=(1, 3))
+        cores = cores.astype(np.uint8)
+
+        # Assim como no draw_pixel, pixels pretos não são escritos, preservando o que
+        # as primitivas 2D desenharam diretamente no Framebuffer
+        mascara = cores.any(axis=2)
+        ys, xs = np.nonzero(mascara)
+        gpu.GPU.draw_pixels(np.column_stack((xs, ys)), gpu.GPU.RGB8, cores[mascara])
+
+    @staticmethod
+    def tent_filter(buffer, factor):
+        """Filtro tenda (triangular) separável com largura de 2 pixels da tela."""
+        # Peso de cada amostra vizinha conforme a distância ao centro do pixel
+        deslocamentos = np.arange(-factor, 2 * factor)
+        pesos = np.maximum(0, 1 - np.abs(deslocamentos + 0.5 - factor / 2) / factor)
+        pesos /= pesos.sum()
+        taps = [(k, p) for k, p in zip(deslocamentos, pesos) if p > 0]
+
+        borda = np.pad(buffer, ((factor, factor), (factor, factor), (0, 0)), mode='edge')
+        altura = GL.height * factor
+        largura = GL.width * factor
+
+        # Filtra as linhas e depois as colunas, amostrando no passo do supersampling
+        linhas = sum(p * borda[factor + k:factor + k + altura:factor] for k, p in taps)
+        return sum(p * linhas[:, factor + k:factor + k + largura:factor] for k, p in taps)
+
     @staticmethod
     def polypoint2D(point, colors):
         """Função usada para renderizar Polypoint2D."""
         # Encontrando a cor
         lista_rgb = [int(round(c * 255)) for c in colors['emissiveColor']]
  
-        # Encontrando os pontos
-        for i in range(0, len(point), 2):
-            pos_x = int(point[i])
-            pos_y = int(point[i + 1])
-            gpu.GPU.draw_pixel([pos_x, pos_y], gpu.GPU.RGB8, lista_rgb)
+        # Encontrando os pontos e desenhando todos de uma vez
+        point = np.asarray(point, dtype=float).reshape(-1)
+        if any(lista_rgb) and len(point) > 1:
+            coords = point[:len(point) // 2 * 2].reshape(-1, 2).astype(int)
+            gpu.GPU.draw_pixels(coords, gpu.GPU.RGB8, np.tile(lista_rgb, (len(coords), 1)))
  
     @staticmethod
     def polyline2D(lineSegments, colors):
@@ -102,6 +192,7 @@ class GL:
         # você pode assumir inicialmente o desenho das linhas com a cor emissiva (emissiveColor).
         # Função auxiliar para desenhar uma linha entre dois pontos (x0, y0) e (x1, y1)
         points_to_draw = []
+        lineSegments = np.asarray(lineSegments, dtype=np.float64).reshape(-1).tolist()
  
         # Itera pelos pares de pontos na lista lineSegments
         for i in range(0, len(lineSegments) - 2, 2):
@@ -170,134 +261,569 @@ class GL:
 
         emissive_color = [int(c * 255) for c in colors.get('emissiveColor', [1, 1, 1])]
         transparency = colors.get('transparency', 0)
-        opacity = 1 - transparency
 
+        # Organiza os dados em matrizes com um triângulo por linha
+        vertices = np.asarray(vertices, dtype=np.float64).reshape(-1)
+        num_triangulos = len(vertices) // 6
+        pontos = np.asarray(vertices[:num_triangulos * 6], dtype=np.float64).reshape(-1, 3, 2)
+
+        # Profundidades (se disponíveis)
+        zs = np.zeros((num_triangulos, 3))
+        if z_values is not None and len(z_values):
+            n = min(len(z_values) // 3, num_triangulos)
+            zs[:n] = np.asarray(z_values[:n * 3], dtype=np.float64).reshape(-1, 3)
+
+        # Cores por vértice (se houver cores suficientes), senão a cor emissiva
+        cores = np.empty((num_triangulos, 3, 3), dtype=np.int64)
+        cores[:] = emissive_color
+        if vertex_colors is not None and len(vertex_colors):
+            vertex_colors = np.asarray(vertex_colors, dtype=np.float64).reshape(-1)
+            n = min(len(vertex_colors) // 9, num_triangulos)
+            cores[:n] = (vertex_colors[:n * 9] * 255).astype(np.int64).reshape(-1, 3, 3)
+
+        # Coordenadas de textura (se disponíveis)
+        uvs = None
+        if tex_coords is not None and len(tex_coords) and GL.current_texture is not None:
+            tex_coords = np.asarray(tex_coords, dtype=np.float64).reshape(-1)
+            uvs = tex_coords[:num_triangulos * 6].reshape(-1, 3, 2)
+
+        GL.rasteriza_triangulos(pontos, zs, cores, uvs, transparency)
+
+    @staticmethod
+    def rasteriza_triangulos(pontos, zs, cores, uvs, transparency, luz=None, atributos=None):
+        """Rasteriza um lote de triângulos já em coordenadas de tela."""
+        # pontos é uma matriz (M, 3, 2) com as posições x, y de cada vértice na tela, zs uma
+        # matriz (M, 3) com as profundidades, cores uma matriz (M, 3, 3) de inteiros de 0 a
+        # 255 e uvs uma matriz (M, 3, 2) com as coordenadas de textura ou None. luz diz como
+        # os fragmentos são iluminados (veja sombreia) e atributos (M, 3, 6) traz a posição e
+        # a normal de cada vértice no sistema da câmera, usadas no sombreamento por fragmento
+        # (no sombreamento adiado, atributos (M, 3, 3) traz só as normais).
         factor = GL.supersampling_factor
 
-        # Processa cada triângulo
-        num_vertices = len(vertices)
-        for i in range(0, num_vertices - 5, 6):
-            # Extrai vértices do triângulo
-            x0, y0 = vertices[i], vertices[i + 1]
-            x1, y1 = vertices[i + 2], vertices[i + 3]
-            x2, y2 = vertices[i + 4], vertices[i + 5]
-
-            # Coordenadas de textura (se disponíveis)
-            if tex_coords:
-                u0, v0 = tex_coords[i // 2]
-                u1, v1 = tex_coords[(i // 2) + 1]
-                u2, v2 = tex_coords[(i // 2) + 2]
+        # Descarta triângulos com coordenadas inválidas
+        validos = np.isfinite(pontos).all(axis=(1, 2)) & np.isfinite(zs).all(axis=1)
+
+        # Coordenadas no super buffer, bounding boxes e denominadores de todos os triângulos
+        p = np.zeros(pontos.shape, dtype=np.int64)
+        p[validos] = np.round(pontos[validos] * factor)
+        min_x = np.maximum(p[:, :, 0].min(axis=1), 0)
+        max_x = np.minimum(p[:, :, 0].max(axis=1), GL.super_width - 1)
+        min_y = np.maximum(p[:, :, 1].min(axis=1), 0)
+        max_y = np.minimum(p[:, :, 1].max(axis=1), GL.super_height - 1)
+        denom = (p[:, 1, 1] - p[:, 2, 1])*(p[:, 0, 0] - p[:, 2, 0]) + \
+                (p[:, 2, 0] - p[:, 1, 0])*(p[:, 0, 1] - p[:, 2, 1])
+
+        # Triângulos degenerados ou fora da tela são ignorados
+        desenhar = validos & (denom != 0) & (min_x <= max_x) & (min_y <= max_y)
+
+        # A textura vai junto com cada triângulo, já que no modo por tiles ele só é
+        # rasterizado no fim do quadro
+        textura = (GL.current_texture, GL.texture_params) if uvs is not None else None
+        rasteriza = GL.rasterizador()
+
+        # Luzes que alcançam a bounding box de cada triângulo (M, L); triângulos com o
+        # mesmo conjunto de luzes compartilham as matrizes recortadas
+        if luz is not None and luz[0] == "phong" and GL.culling_luzes:
+            regiao = luz[2]['regiao']
+            alcancam = ((regiao[:, 0] <= max_x[:, np.newaxis]) & (regiao[:, 1] >= min_x[:, np.newaxis]) &
+                        (regiao[:, 2] <= max_y[:, np.newaxis]) & (regiao[:, 3] >= min_y[:, np.newaxis]))
+            conjuntos = {}
+
+        for t in np.nonzero(desenhar)[0]:
+            pontos_t = tuple(map(tuple, p[t].tolist()))
+            caixa = (int(min_x[t]), int(max_x[t]), int(min_y[t]), int(max_y[t]))
+            uvs_t = tuple(map(tuple, uvs[t].tolist())) if uvs is not None else None
+            sombra = None
+            if luz is not None and luz[0] in ("phong", "gbuffer"):
+                sombra = (luz[0], atributos[t].tolist()) + luz[1:]
+                if luz[0] == "phong" and GL.culling_luzes:
+                    chave = alcancam[t].tobytes()
+                    if chave not in conjuntos:
+                        conjuntos[chave] = GL.seleciona_luzes(luz[2], alcancam[t])
+                    sombra = sombra[:3] + (conjuntos[chave],)
+            elif luz is not None and uvs is not None:
+                sombra = luz
+            triangulo = (pontos_t, tuple(zs[t].tolist()), cores[t].tolist(), uvs_t,
+                         transparency, caixa, int(denom[t]), textura, sombra)
+            if GL.deferred and transparency:
+                GL.fila_transparentes.append(triangulo)
+            elif GL.tiled:
+                GL.fila_triangulos.append(triangulo)
             else:
-                u0 = v0 = u1 = v1 = u2 = v2 = 0  # Valores padrão
-
-            # Verifica se há cores por vértice suficientes
-            if vertex_colors and len(vertex_colors) >= ((i // 6) * 9) + 9:
-                idx = (i // 6) * 9
-                c0 = [int(c * 255) for c in vertex_colors[idx:idx + 3]]
-                c1 = [int(c * 255) for c in vertex_colors[idx + 3:idx + 6]]
-                c2 = [int(c * 255) for c in vertex_colors[idx + 6:idx + 9]]
-            else:
-                c0 = c1 = c2 = emissive_color
+                rasteriza(*triangulo)
+
+    @staticmethod
+    def rasterizador():
+        """Retorna a rotina de rasterização de um triângulo conforme GL.rasterizacao."""
+        if GL.rasterizacao == "escalar":
+            return GL.rasteriza_escalar
+        return GL.rasteriza_vetorizada
 
-            if z_values and len(z_values) >= (i // 6) * 3 + 3:
-                z0 = z_values[(i // 6) * 3]
-                z1 = z_values[(i // 6) * 3 + 1]
-                z2 = z_values[(i // 6) * 3 + 2]
+    @staticmethod
+    def flush():
+        """Termina o quadro: rasteriza as filas de triângulos e ilumina o G-buffer."""
+        fila, GL.fila_triangulos = GL.fila_triangulos, []
+        GL.rasteriza_fila(fila)
+        if GL.deferred:
+            GL.sombreia_gbuffer()
+            transparentes, GL.fila_transparentes = GL.fila_transparentes, []
+            if GL.tiled:
+                GL.rasteriza_fila(transparentes)
             else:
-                z0 = z1 = z2 = 0
-
-            x0_s, y0_s = int(round(x0 * factor)), int(round(y0 * factor))
-            x1_s, y1_s = int(round(x1 * factor)), int(round(y1 * factor))
-            x2_s, y2_s = int(round(x2 * factor)), int(round(y2 * factor))
-
-            min_x = max(min(x0_s, x1_s, x2_s), 0)
-            max_x = min(max(x0_s, x1_s, x2_s), GL.super_width - 1)
-            min_y = max(min(y0_s, y1_s, y2_s), 0)
-            max_y = min(max(y0_s, y1_s, y2_s), GL.super_height - 1)
-
-            denom = ((y1_s - y2_s)*(x0_s - x2_s) + (x2_s - x1_s)*(y0_s - y2_s))
-            if denom == 0:
-                continue  # Triângulo degenerado
-
-            # Itera sobre a bounding box
-            for y in range(min_y, max_y + 1):
-                for x in range(min_x, max_x + 1):
-
-                    w0 = ((y1_s - y2_s)*(x - x2_s) + (x2_s - x1_s)*(y - y2_s)) / denom
-                    w1 = ((y2_s - y0_s)*(x - x2_s) + (x0_s - x2_s)*(y - y2_s)) / denom
-                    w2 = 1 - w0 - w1
-
-                    # Verifica se o ponto está dentro do triângulo
-                    if w0 >= 0 and w1 >= 0 and w2 >= 0:
-                        # Interpola Z
-                        z = w0 * z0 + w1 * z1 + w2 * z2
-
-                        # Teste do Z-buffer
-                        if z < GL.z_buffer[y, x]:
-                            GL.z_buffer[y, x] = z
-
-                            # Interpola cor ou textura
-                            if tex_coords and GL.current_texture is not None:
-                                # Interpola coordenadas de textura
-                                u = w0 * u0 + w1 * u1 + w2 * u2
-                                v = w0 * v0 + w1 * v1 + w2 * v2
-
-                                # Mapear (u, v) para coordenadas de pixel na textura
-                                tex_width = GL.current_texture.shape[1]
-                                tex_height = GL.current_texture.shape[0]
-                                tex_x = int((v) * (tex_width - 1))
-                                tex_y = int((1-u)  * (tex_height - 1))
-
-                                # Garantir que as coordenadas estejam dentro dos limites
-                                tex_x = np.clip(tex_x, 0, tex_width - 1)
-                                tex_y = np.clip(tex_y, 0, tex_height - 1)
-
-                                # Obter a cor do pixel da textura
-                                color = GL.current_texture[tex_y, tex_x][:3]
-                            else:
-                                # Interpola cor
-                                r = w0 * c0[0] + w1 * c1[0] + w2 * c2[0]
-                                g = w0 * c0[1] + w1 * c1[1] + w2 * c2[1]
-                                b = w0 * c0[2] + w1 * c1[2] + w2 * c2[2]
-                                color = [int(r), int(g), int(b)]
-
-                            existing_color = GL.super_buffer[y, x]
-                            blended_color = [
-                                int(opacity * color[0] + transparency * existing_color[0]),
-                                int(opacity * color[1] + transparency * existing_color[1]),
-                                int(opacity * color[2] + transparency * existing_color[2]),
-                            ]
-
-                            GL.super_buffer[y, x] = blended_color
-
-
-        GL.downsample()
-    
+                rasteriza = GL.rasterizador()
+                for triangulo in transparentes:
+                    rasteriza(*triangulo)
+        if GL.nevoa is not None:
+            GL.aplica_nevoa()
+
     @staticmethod
-    def transform_point(point):
-        """Aplica transformações a um ponto."""
-        ponto_homogeneo = np.array([point[0], point[1], point[2], 1])
-        # Aplica transformações
-        matriz_modelo = GL.matrizes['transform_in'][-1]
-        ponto_transformado = matriz_modelo @ ponto_homogeneo
-        ponto_camera = GL.matrizes['viewpoint'] @ ponto_transformado
-        ponto_perspectiva = GL.matrizes['perspective'] @ ponto_camera
-        ponto_normalizado = ponto_perspectiva / ponto_perspectiva[3]
+    def rasteriza_fila(fila):
+        """Rasteriza triângulos acumulados por tiles, um tile por tarefa."""
+        # Cada triângulo é distribuído (binning) nos tiles que sua bounding box cobre, na
+        # ordem em que foi desenhado, o que preserva a mistura das transparências. Como os
+        # tiles não se sobrepõem, as threads escrevem em regiões disjuntas do super buffer e
+        # do Z-buffer. O laço por triângulo é Python e segura o GIL, então as threads só
+        # rendem nas contas do NumPy sobre tiles grandes; com uma thread os tiles rodam direto.
+        if not fila:
+            return
+
+        tam = GL.tile_size
+        tiles = {}
+        for triangulo in fila:
+            min_x, max_x, min_y, max_y = triangulo[5]
+            for ty in range(min_y // tam, max_y // tam + 1):
+                for tx in range(min_x // tam, max_x // tam + 1):
+                    tiles.setdefault((tx, ty), []).append(triangulo)
+
+        if GL.num_threads is None or GL.num_threads <= 1 or len(tiles) == 1:
+            for tile, triangulos in tiles.items():
+                GL.rasteriza_tile(tile, triangulos)
+            return
+        if GL.executor is None or GL.executor_threads != GL.num_threads:
+            if GL.executor is not None:
+                GL.executor.shutdown()
+            GL.executor = ThreadPoolExecutor(max_workers=GL.num_threads)
+            GL.executor_threads = GL.num_threads
+        list(GL.executor.map(GL.rasteriza_tile, tiles.keys(), tiles.values()))
+
+    @staticmethod
+    def rasteriza_tile(tile, triangulos):
+        """Rasteriza os triângulos de um tile, recortando cada bounding box pelo tile."""
+        tam = GL.tile_size
+        tile_x, tile_y = tile[0] * tam, tile[1] * tam
+        rasteriza = GL.rasterizador()
+        for pontos, zs, cores, uvs, transparency, caixa, denom, textura, sombra in triangulos:
+            min_x, max_x, min_y, max_y = caixa
+            recorte = (max(min_x, tile_x), min(max_x, tile_x + tam - 1),
+                       max(min_y, tile_y), min(max_y, tile_y + tam - 1))
+            rasteriza(pontos, zs, cores, uvs, transparency, recorte, denom, textura, sombra)
+
+    @staticmethod
+    def rasteriza_escalar(pontos, zs, cores, uvs, transparency, caixa, denom, textura,
+                          sombra=None):
+        """Rasteriza um triângulo pixel a pixel (caminho de referência)."""
+        (x0_s, y0_s), (x1_s, y1_s), (x2_s, y2_s) = pontos
+        z0, z1, z2 = zs
+        c0, c1, c2 = cores
+        min_x, max_x, min_y, max_y = caixa
+        opacity = 1 - transparency
+        z_buffer = gpu.GPU.get_depth_buffer()
+
+        # Nível de detalhe da textura, constante no triângulo
+        if uvs is not None:
+            lod = GL.nivel_mipmap(pontos, uvs, denom, textura[0])
+
+        # Itera sobre a bounding box
+        for y in range(min_y, max_y + 1):
+            for x in range(min_x, max_x + 1):
+
+                w0 = ((y1_s - y2_s)*(x - x2_s) + (x2_s - x1_s)*(y - y2_s)) / denom
+                w1 = ((y2_s - y0_s)*(x - x2_s) + (x0_s - x2_s)*(y - y2_s)) / denom
+                w2 = 1 - w0 - w1
+
+                # Verifica se o ponto está dentro do triângulo
+                if w0 >= 0 and w1 >= 0 and w2 >= 0:
+                    # Interpola Z e converte para o formato do Z-buffer
+                    z = gpu.GPU.depth_value(w0 * z0 + w1 * z1 + w2 * z2, z_buffer.dtype)
+
+                    # Teste do Z-buffer
+                    if z < z_buffer[y, x]:
+                        z_buffer[y, x] = z
+
+                        # Interpola cor ou textura
+                        if uvs is not None:
+                            (u0, v0), (u1, v1), (u2, v2) = uvs
+
+                            # Interpola coordenadas de textura
+                            u = w0 * u0 + w1 * u1 + w2 * u2
+                            v = w0 * v0 + w1 * v1 + w2 * v2
+
+                            # Obter a cor da textura nessa posição
+                            color = GL.amostra_textura(np.array([u]), np.array([v]), lod, textura)[0]
+                        else:
+                            # Interpola cor
+                            r = w0 * c0[0] + w1 * c1[0] + w2 * c2[0]
+                            g = w0 * c0[1] + w1 * c1[1] + w2 * c2[1]
+                            b = w0 * c0[2] + w1 * c1[2] + w2 * c2[2]
+                            color = [int(r), int(g), int(b)]
+
+                        pesos = (np.array([[w0]]), np.array([[w1]]), np.array([[w2]]))
+                        if GL.deferred:
+                            GL.grava_gbuffer(sombra, np.array([y]), np.array([x]),
+                                             np.array([color]), *pesos)
+                            if sombra is not None and sombra[0] == "gbuffer":
+                                continue
+                        if sombra is not None:
+                            color = GL.sombreia(sombra, np.array([color]), cores, *pesos)[0]
+
+                        existing_color = GL.super_buffer[y, x]
+                        blended_color = [
+                            int(opacity * color[0] + transparency * existing_color[0]),
+                            int(opacity * color[1] + transparency * existing_color[1]),
+                            int(opacity * color[2] + transparency * existing_color[2]),
+                        ]
+
+                        GL.super_buffer[y, x] = blended_color
+
+    @staticmethod
+    def rasteriza_vetorizada(pontos, zs, cores, uvs, transparency, caixa, denom, textura,
+                             sombra=None):
+        """Rasteriza um triângulo avaliando toda a bounding box de uma vez com o NumPy."""
+        # Mesmas contas do caminho escalar, só que sobre matrizes do tamanho da bounding
+        # box, então o resultado é idêntico pixel a pixel.
+        (x0_s, y0_s), (x1_s, y1_s), (x2_s, y2_s) = pontos
+        z0, z1, z2 = zs
+        min_x, max_x, min_y, max_y = caixa
+        opacity = 1 - transparency
+
+        if min_x > max_x or min_y > max_y:
+            return  # Triângulo totalmente fora da tela
+
+        y, x = np.mgrid[min_y:max_y + 1, min_x:max_x + 1]
+
+        # Funções de aresta normalizadas (coordenadas baricêntricas)
+        w0 = ((y1_s - y2_s)*(x - x2_s) + (x2_s - x1_s)*(y - y2_s)) / denom
+        w1 = ((y2_s - y0_s)*(x - x2_s) + (x0_s - x2_s)*(y - y2_s)) / denom
+        w2 = 1 - w0 - w1
+
+        # Cobertura e teste do Z-buffer, no formato de profundidade do Framebuffer
+        z_regiao = gpu.GPU.get_depth_buffer()[min_y:max_y + 1, min_x:max_x + 1]
+        z = gpu.GPU.depth_value(w0 * z0 + w1 * z1 + w2 * z2, z_regiao.dtype)
+        mascara = (w0 >= 0) & (w1 >= 0) & (w2 >= 0) & (z < z_regiao)
+        if not mascara.any():
+            return
+
+        z_regiao[mascara] = z[mascara]
+        w0 = w0[mascara][:, np.newaxis]
+        w1 = w1[mascara][:, np.newaxis]
+        w2 = w2[mascara][:, np.newaxis]
+
+        # Interpola cor ou textura
+        if uvs is not None:
+            (u0, v0), (u1, v1), (u2, v2) = uvs
+            u = w0[:, 0] * u0 + w1[:, 0] * u1 + w2[:, 0] * u2
+            v = w0[:, 0] * v0 + w1[:, 0] * v1 + w2[:, 0] * v2
+
+            color = GL.amostra_textura(u, v, GL.nivel_mipmap(pontos, uvs, denom, textura[0]),
+                                       textura)
+        else:
+            c0, c1, c2 = (np.array(c) for c in cores)
+            color = (w0 * c0 + w1 * c1 + w2 * c2).astype(np.int64)
+
+        if GL.deferred:
+            GL.grava_gbuffer(sombra, y[mascara], x[mascara], color, w0, w1, w2)
+            if sombra is not None and sombra[0] == "gbuffer":
+                return
+        if sombra is not None:
+            color = GL.sombreia(sombra, color, cores, w0, w1, w2)
+
+        # Mistura com o que já está no buffer (transparência)
+        cor_regiao = GL.super_buffer[min_y:max_y + 1, min_x:max_x + 1]
+        existing_color = cor_regiao[mascara]
+        blended_color = (opacity * color + transparency * existing_color).astype(np.int64)
+        cor_regiao[mascara] = blended_color
+
+    @staticmethod
+    def sombreia(sombra, cor, cores, w0, w1, w2):
+        """Ilumina um lote de fragmentos de um triângulo, retornando as cores (N, 3) de 0 a 255."""
+        # sombra é ("modula",), quando a luz foi calculada nos vértices (Gouraud) e só
+        # multiplica a textura, ou ("phong", atributos, material, luzes), com a posição e a
+        # normal dos vértices para iluminar cada fragmento; cor é a cor difusa (textura ou
+        # cor interpolada) e w0, w1, w2 (N, 1) as coordenadas baricêntricas dos fragmentos.
+        if sombra[0] == "modula":
+            c0, c1, c2 = (np.array(c) for c in cores)
+            return cor * (w0 * c0 + w1 * c1 + w2 * c2) / 255
+        _, atributos, material, luzes = sombra
+        a0, a1, a2 = (np.array(a) for a in atributos)
+        interpolados = w0 * a0 + w1 * a1 + w2 * a2
+        return GL.ilumina(interpolados[:, :3], interpolados[:, 3:], cor / 255,
+                          material, luzes) * 255
+
+    @staticmethod
+    def grava_gbuffer(sombra, ys, xs, cor, w0, w1, w2):
+        """Grava no G-buffer os fragmentos (ys, xs) que passaram no teste de profundidade."""
+        # Fragmentos sem sombra "gbuffer" já têm a cor final e recebem o material 0, para
+        # que o passo de iluminação não sobrescreva o que eles pintaram
+        albedo, normal, ids = GL.gbuffer()
+        if sombra is None or sombra[0] != "gbuffer":
+            ids[ys, xs] = 0
+            return
+        _, normais, material = sombra
+        n0, n1, n2 = (np.array(n) for n in normais)
+        albedo[ys, xs] = cor / 255
+        normal[ys, xs] = w0 * n0 + w1 * n1 + w2 * n2
+        ids[ys, xs] = material
+
+    @staticmethod
+    def gbuffer():
+        """Canais do G-buffer no Framebuffer de desenho: albedo, normal e material."""
+        return (gpu.GPU.get_attachment(gpu.GPU.draw_framebuffer, gpu.GPU.COLOR_ATTACHMENT1),
+                gpu.GPU.get_attachment(gpu.GPU.draw_framebuffer, gpu.GPU.COLOR_ATTACHMENT2),
+                gpu.GPU.get_attachment(gpu.GPU.draw_framebuffer, gpu.GPU.COLOR_ATTACHMENT3)[:, :, 0])
+
+    @staticmethod
+    def id_material(material):
+        """Identificador do material no quadro, reaproveitando materiais iguais."""
+        especular, emissiva, brilho, intensidade_ambiente = material
+        chave = (tuple(especular), tuple(emissiva), float(brilho), float(intensidade_ambiente))
+        if chave not in GL.ids_materiais:
+            GL.ids_materiais[chave] = len(GL.materiais)
+            GL.materiais.append(chave)
+        return GL.ids_materiais[chave]
+
+    @staticmethod
+    def sombreia_gbuffer():
+        """Passo de tela inteira: ilumina de uma vez cada amostra do G-buffer."""
+        # A posição de cada amostra no sistema da câmera é reconstruída da profundidade
+        # pela inversa da projeção, e os materiais são indexados pelos identificadores
+        luzes = GL.luzes_do_quadro()
+        albedo, normal, ids = GL.gbuffer()
+        ys, xs = np.nonzero(ids)
+        if luzes is None or not len(ys):
+            return
+
+        materiais = GL.materiais[1:]
+        especular = np.array([[0, 0, 0]] + [m[0] for m in materiais], dtype=np.float64)
+        emissiva = np.array([[0, 0, 0]] + [m[1] for m in materiais], dtype=np.float64)
+        brilho = np.array([0] + [m[2] for m in materiais], dtype=np.float64)
+        ambiente = np.array([0] + [m[3] for m in materiais], dtype=np.float64)
+
+        # Culling por tiles: as amostras são agrupadas pelo conjunto de luzes do seu tile,
+        # e cada grupo é iluminado só com essas luzes
+        grupos = [(ys, xs, luzes)]
+        if GL.culling_luzes:
+            tam = GL.tile_size
+            colunas = -(-GL.super_width // tam)
+            linhas = -(-GL.super_height // tam)
+            ty, tx = np.divmod(np.arange(linhas * colunas), colunas)
+            regiao = luzes['regiao']
+            alcancam = ((regiao[:, 0] <= (tx * tam + tam - 1)[:, np.newaxis]) &
+                        (regiao[:, 1] >= (tx * tam)[:, np.newaxis]) &
+                        (regiao[:, 2] <= (ty * tam + tam - 1)[:, np.newaxis]) &
+                        (regiao[:, 3] >= (ty * tam)[:, np.newaxis]))
+            conjuntos, conjunto_do_tile = np.unique(alcancam, axis=0, return_inverse=True)
+            grupo = conjunto_do_tile.reshape(-1)[(ys // tam) * colunas + xs // tam]
+            ordem = np.argsort(grupo, kind="stable")
+            limites = np.searchsorted(grupo[ordem], np.arange(len(conjuntos) + 1))
+            grupos = [(ys[ordem[a:b]], xs[ordem[a:b]], GL.seleciona_luzes(luzes, conjunto))
+                      for a, b, conjunto in zip(limites[:-1], limites[1:], conjuntos) if a < b]
+
+        profundidade = gpu.GPU.get_depth_buffer()
+        inversa = np.linalg.inv(GL.matrizes['perspective'])
+        for grupo_y, grupo_x, grupo_luzes in grupos:
+            GL.sombreia_amostras(grupo_y, grupo_x, grupo_luzes, profundidade, inversa, albedo, normal, ids,
+                                 (especular, emissiva, brilho, ambiente))
+
+    @staticmethod
+    def sombreia_amostras(ys, xs, luzes, profundidade, inversa, albedo, normal, ids, materiais):
+        """Ilumina, em lotes, as amostras (ys, xs) do G-buffer com as luzes dadas."""
+        especular, emissiva, brilho, ambiente = materiais
+        for inicio in range(0, len(ys), GL.pixels_por_lote):
+            y = ys[inicio:inicio + GL.pixels_por_lote]
+            x = xs[inicio:inicio + GL.pixels_por_lote]
+            z = profundidade[y, x].astype(np.float64)
+            if profundidade.dtype == np.uint16:
+                z /= 65535
+            ndc = np.column_stack((2 * x / GL.super_width - 1, 1 - 2 * y / GL.super_height,
+                                   2 * z - 1, np.ones(len(z))))
+            posicoes = ndc @ inversa.T
+            posicoes = posicoes[:, :3] / posicoes[:, 3:]
+
+            m = ids[y, x]
+            cor = GL.ilumina(posicoes, normal[y, x].astype(np.float64), albedo[y, x],
+                             (especular[m], emissiva[m], brilho[m], ambiente[m]), luzes)
+            GL.super_buffer[y, x] = (cor * 255).astype(np.int64)
+
+    @staticmethod
+    def ilumina(posicoes, normais, difusa, material, luzes):
+        """Equação de iluminação do X3D para N pontos de uma vez, somando todas as luzes."""
+        # posicoes e normais são matrizes (N, 3) no sistema da câmera e difusa (N, 3) a cor
+        # difusa de 0 a 1. As contas são feitas em matrizes (N, L) de pontos por luzes. O
+        # material é o mesmo para todos os pontos ou, no sombreamento adiado, um por ponto.
+        especular, emissiva, brilho, intensidade_ambiente = material
+        especular = np.reshape(especular, (-1, 1, 3))
+        emissiva = np.reshape(emissiva, (-1, 3))
+        brilho = np.reshape(brilho, (-1, 1))
+        intensidade_ambiente = np.reshape(intensidade_ambiente, (-1, 1, 1))
+        normais = normais / np.maximum(np.linalg.norm(normais, axis=1, keepdims=True), 1e-12)
+        visao = -posicoes / np.maximum(np.linalg.norm(posicoes, axis=1, keepdims=True), 1e-12)
+
+        # Iluminação dos dois lados: a normal é virada para o observador
+        normais = np.where((normais * visao).sum(axis=1, keepdims=True) < 0, -normais, normais)
+
+        # Direção para cada luz e atenuação (as direcionais não atenuam)
+        pontual = luzes['pontual'] > 0
+        para_luz = luzes['posicao'][np.newaxis] - posicoes[:, np.newaxis]
+        distancia = np.linalg.norm(para_luz, axis=2)
+        para_luz = np.where(pontual[np.newaxis, :, np.newaxis],
+                            para_luz / np.maximum(distancia, 1e-12)[:, :, np.newaxis],
+                            -luzes['direcao'][np.newaxis])
+        a = luzes['atenuacao']
+        atenuacao = 1 / np.maximum(a[:, 0] + a[:, 1] * distancia + a[:, 2] * distancia ** 2, 1)
+        atenuacao = np.where(pontual, atenuacao, 1.0)
+        atenuacao = np.where(pontual & (distancia > luzes['raio']), 0.0, atenuacao)
+
+        # Termos difuso e especular (Blinn-Phong com o expoente shininess * 128)
+        n_l = np.einsum('nk,nlk->nl', normais, para_luz)
+        meio = para_luz + visao[:, np.newaxis]
+        meio /= np.maximum(np.linalg.norm(meio, axis=2, keepdims=True), 1e-12)
+        n_h = np.maximum(np.einsum('nk,nlk->nl', normais, meio), 0)
+        brilho_especular = np.where(n_l > 0, n_h ** (brilho * 128), 0)
+        n_l = np.maximum(n_l, 0)
+
+        difusa = difusa[:, np.newaxis]
+        contribuicao = (luzes['ambiente'] * difusa * intensidade_ambiente +
+                        luzes['cor'] * difusa * n_l[:, :, np.newaxis] +
+                        luzes['cor'] * especular * brilho_especular[:, :, np.newaxis])
+        cor = emissiva + (atenuacao[:, :, np.newaxis] * contribuicao).sum(axis=1)
+        return np.clip(cor, 0, 1)
+
+    @staticmethod
+    def nivel_mipmap(pontos, uvs, denom, niveis):
+        """Calcula o nível de detalhe da textura a partir das derivadas de (u, v) na tela."""
+        # As coordenadas de textura são interpoladas linearmente na tela, então as derivadas
+        # são constantes no triângulo e saem direto das derivadas das coordenadas baricêntricas.
+        (x0_s, y0_s), (x1_s, y1_s), (x2_s, y2_s) = pontos
+        (u0, v0), (u1, v1), (u2, v2) = uvs
+        dw0_dx, dw1_dx = (y1_s - y2_s) / denom, (y2_s - y0_s) / denom
+        dw0_dy, dw1_dy = (x2_s - x1_s) / denom, (x0_s - x2_s) / denom
+        du_dx = dw0_dx * (u0 - u2) + dw1_dx * (u1 - u2)
+        dv_dx = dw0_dx * (v0 - v2) + dw1_dx * (v1 - v2)
+        du_dy = dw0_dy * (u0 - u2) + dw1_dy * (u1 - u2)
+        dv_dy = dw0_dy * (v0 - v2) + dw1_dy * (v1 - v2)
+
+        # Tamanho da pegada de um pixel em texels (u segue as linhas e v as colunas)
+        linhas, colunas = niveis[0].shape[:2]
+        rho = max(math.hypot(du_dx * (linhas - 1), dv_dx * (colunas - 1)),
+                  math.hypot(du_dy * (linhas - 1), dv_dy * (colunas - 1)))
+        return math.log2(rho) if rho > 0 else -math.inf
+
+    @staticmethod
+    def amostra_textura(u, v, lod, textura):
+        """Amostra a textura para um lote de coordenadas (u, v) com o filtro da textura."""
+        # textura é o par (cadeia de mipmaps, parâmetros de amostragem) e o retorno é uma
+        # matriz (N, 3) com as cores dos N fragmentos.
+        niveis, params = textura
+        if lod > 0:
+            filtro, mipmap = params.filtro_min, params.mipmap
+        else:
+            filtro, mipmap = params.filtro_mag, None  # na magnificação só existe o nível 0
+
+        # Modos de repetição (repeatS/repeatT); u corresponde a s e v a t
+        u = GL.repete(u, params.repeatS)
+        v = GL.repete(v, params.repeatT)
+
+        if mipmap is None:
+            return GL.amostra_nivel(niveis[0], u, v, filtro, params)
+
+        nivel = min(max(lod, 0), len(niveis) - 1)
+        if mipmap == "nearest":
+            return GL.amostra_nivel(niveis[int(round(nivel))], u, v, filtro, params)
+
+        # Mipmap linear: mistura os dois níveis mais próximos
+        n0 = int(nivel)
+        n1 = min(n0 + 1, len(niveis) - 1)
+        f = nivel - n0
+        cor = GL.amostra_nivel(niveis[n0], u, v, filtro, params)
+        if f > 0:
+            cor = (1 - f) * cor + f * GL.amostra_nivel(niveis[n1], u, v, filtro, params)
+        return cor
+
+    @staticmethod
+    def amostra_nivel(tex, u, v, filtro, params):
+        """Amostra um nível da textura com o texel mais próximo ("nearest") ou bilinear."""
+        if filtro == "nearest":
+            tex_x = (v * (tex.shape[1] - 1)).astype(np.int64)
+            tex_y = ((1-u) * (tex.shape[0] - 1)).astype(np.int64)
+            return tex[tex_y, tex_x][:, :3]
+        return GL.amostra_bilinear(tex, u, v, params)
+
+    @staticmethod
+    def amostra_bilinear(tex, u, v, params):
+        """Interpola bilinearmente os quatro texels vizinhos de cada coordenada (u, v)."""
+        linhas, colunas = tex.shape[:2]
+        x = v * (colunas - 1)
+        y = (1-u) * (linhas - 1)
+        x0 = np.floor(x).astype(np.int64)
+        y0 = np.floor(y).astype(np.int64)
+        fx = (x - x0)[:, np.newaxis]
+        fy = (y - y0)[:, np.newaxis]
+
+        # Vizinhos seguintes, repetindo a textura ou presos na borda
+        x1 = x0 + 1
+        y1 = y0 + 1
+        x1 = x1 % colunas if params.repeatT else np.minimum(x1, colunas - 1)
+        y1 = y1 % linhas if params.repeatS else np.minimum(y1, linhas - 1)
+
+        tex = tex[:, :, :3]
+        return (tex[y0, x0] * ((1 - fx) * (1 - fy)) + tex[y0, x1] * (fx * (1 - fy)) +
+                tex[y1, x0] * ((1 - fx) * fy) + tex[y1, x1] * (fx * fy))
+
+    @staticmethod
+    def repete(coord, repeat):
+        """Leva as coordenadas de textura para [0, 1] repetindo ou prendendo na borda."""
+        if repeat:
+            fora = (coord < 0) | (coord > 1)
+            return np.where(fora, coord - np.floor(coord), coord)
+        return np.clip(coord, 0, 1)
+
+    @staticmethod
+    def transform_points(points):
+        """Aplica transformações a vários pontos (N, 3) de uma só vez."""
+        return GL.divisao_perspectiva(GL.clip_points(points))
+
+    @staticmethod
+    def clip_points(points):
+        """Leva vários pontos (N, 3) para o espaço de recorte, em coordenadas homogêneas (N, 4)."""
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+
+        # Compõe modelo, visualização e projeção uma única vez
+        matriz_mvp = GL.matrizes['perspective'] @ GL.matrizes['viewpoint'] @ GL.matrizes['transform_in'][-1]
+
+        pontos_homogeneos = np.hstack((points, np.ones((len(points), 1))))
+        return pontos_homogeneos @ matriz_mvp.T
+
+    @staticmethod
+    def divisao_perspectiva(pontos_perspectiva):
+        """Faz a divisão perspectiva e leva os pontos (N, 4) para coordenadas de tela."""
+        pontos_normalizados = pontos_perspectiva[:, :3] / pontos_perspectiva[:, 3:]
+
         # Converte para coordenadas de tela
-        x_ndc = ponto_normalizado[0]
-        y_ndc = ponto_normalizado[1]
-        z_ndc = ponto_normalizado[2]
-        x_tela = (x_ndc + 1) * GL.width * 0.5
-        y_tela = (1 - y_ndc) * GL.height * 0.5
-        z_depth = (z_ndc + 1) * 0.5  
+        x_tela = (pontos_normalizados[:, 0] + 1) * GL.width * 0.5
+        y_tela = (1 - pontos_normalizados[:, 1]) * GL.height * 0.5
+        z_depth = (pontos_normalizados[:, 2] + 1) * 0.5
 
-        # print(f"Vértice original: {point}")
-        # print(f"Vértice transformado: x={x_tela}, y={y_tela}, z={z_depth}")
+        return x_tela, y_tela, z_depth
 
-        return [x_tela, y_tela, z_depth]
- 
     @staticmethod
-    def triangleSet(point, colors, vertex_colors=None):
+    def transform_point(point):
+        """Aplica transformações a um ponto."""
+        x_tela, y_tela, z_depth = GL.transform_points(point[:3])
+        return [x_tela[0], y_tela[0], z_depth[0]]
+
+    @staticmethod
+    def triangleSet(point, colors, vertex_colors=None, solid=True, ccw=True, normals=None,
+                    normal_triangles=None):
         """Função usada para renderizar TriangleSet."""
         # https://www.web3d.org/specifications/X3Dv4/ISO-IEC19775-1v4-IS/Part01/components/rendering.html#TriangleSet
         # Nessa função você receberá pontos no parâmetro point, esses pontos são uma lista
@@ -320,19 +846,173 @@ class GL:
         # Exemplo de desenho de um pixel branco na coordenada 10, 10
         #gpu.GPU.draw_pixel([10, 10], gpu.GPU.RGB8, [255, 255, 255])  # altera pixel
  
-        vertices = []
-        z_values = []
- 
-        # Aplica transformações em cada ponto
-        for i in range(0, len(point), 3):
-            transformed = GL.transform_point(point[i:i + 3])
-            vertices.extend([transformed[0], transformed[1]])
-            z_values.append(transformed[2])
-        # print(f"Vértices dos triângulos (2D): {vertices}")
-        # print(f"Valores de profundidade (Z): {z_values}")
+        # Os triângulos são formados por pontos consecutivos, três a três
+        posicoes = np.asarray(point, dtype=np.float64).reshape(-1, 3)
+        indices = np.arange(len(posicoes) // 3 * 3).reshape(-1, 3)
+
+        GL.draw_mesh(posicoes, indices, colors, vertex_colors, solid=solid, ccw=ccw,
+                     normals=normals, normal_indices=normal_triangles)
+
+    @staticmethod
+    def draw_mesh(positions, indices, colors, vertex_colors=None, color_indices=None,
+                  tex_coords=None, tex_indices=None, solid=True, ccw=True,
+                  normals=None, normal_indices=None):
+        """Desenha uma malha de triângulos inteira em uma única chamada."""
+        # positions é uma matriz (N, 3) com as posições dos vértices e indices uma matriz
+        # (M, 3) com os três vértices de cada triângulo. Opcionalmente podem ser passadas
+        # cores por vértice (K, 3), coordenadas de textura (T, 2) e normais (K, 3); se estas
+        # tiverem índices próprios, color_indices, tex_indices e normal_indices são matrizes
+        # (M, 3) como indices, caso contrário são usados os próprios índices dos vértices.
+        # solid e ccw seguem os campos de mesmo nome do X3D e controlam o descarte das
+        # faces de trás.
+        positions = np.asarray(positions, dtype=np.float64).reshape(-1, 3)
+        indices = np.asarray(indices, dtype=np.int64).reshape(-1, 3)
+        if len(indices) == 0:
+            return
+
+        # Cada vértice é transformado uma única vez e o resultado é reaproveitado por
+        # todos os triângulos que o compartilham
+        clip = GL.clip_points(positions)[indices]
+
+        # Cores por vértice, senão a cor emissiva
+        cores = np.empty((len(indices), 3, 3), dtype=np.int64)
+        cores[:] = [int(c * 255) for c in colors.get('emissiveColor', [1, 1, 1])]
+        if vertex_colors is not None and len(vertex_colors):
+            tabela = (np.asarray(vertex_colors, dtype=np.float64).reshape(-1, 3) * 255).astype(np.int64)
+            cores[:] = tabela[indices if color_indices is None else color_indices]
+
+        # Coordenadas de textura, com o eixo v invertido para a leitura da imagem
+        uvs = None
+        if tex_coords is not None and len(tex_coords) and GL.current_texture is not None:
+            tabela = np.asarray(tex_coords, dtype=np.float64).reshape(-1, 2).copy()
+            tabela[:, 1] = 1 - tabela[:, 1]
+            uvs = tabela[indices if tex_indices is None else tex_indices]
+
+        # Iluminação, só para geometrias com Material e com alguma luz acesa no quadro
+        luz, atributos = None, None
+        luzes = GL.luzes_do_quadro() if colors.get('lighting') else None
+        if luzes is not None:
+            vista = GL.matrizes['viewpoint'] @ GL.matrizes['transform_in'][-1]
+            posicoes = (positions @ vista[:3, :3].T + vista[:3, 3])[indices]
+            if normals is not None and len(normals):
+                tabela = np.asarray(normals, dtype=np.float64).reshape(-1, 3)
+                tabela = tabela @ np.linalg.inv(vista[:3, :3])  # matriz normal
+                normais = tabela[indices if normal_indices is None else normal_indices]
+            else:
+                face = np.cross(posicoes[:, 1] - posicoes[:, 0], posicoes[:, 2] - posicoes[:, 0])
+                normais = np.repeat((face if ccw else -face)[:, np.newaxis], 3, axis=1)
+
+            # Cor difusa dos vértices: a cor por vértice, senão a do material
+            if vertex_colors is None or not len(vertex_colors):
+                cores[:] = [int(c * 255) for c in colors.get('diffuseColor', [0.8, 0.8, 0.8])]
+            material = (np.asarray(colors.get('specularColor', [0, 0, 0]), dtype=np.float64),
+                        np.asarray(colors.get('emissiveColor', [0, 0, 0]), dtype=np.float64),
+                        colors.get('shininess', 0.2), colors.get('ambientIntensity', 0.2))
+
+            if GL.deferred and not colors.get('transparency', 0):
+                # Só grava no G-buffer; a luz é calculada no flush, uma vez por amostra
+                atributos = normais
+                luz = ("gbuffer", GL.id_material(material))
+            elif GL.sombreamento == "gouraud":
+                # Luz calculada nos vértices; com textura ela é calculada sobre o branco e
+                # depois modula a cor da textura em cada fragmento
+                difusa = np.ones(cores.shape) if uvs is not None else cores / 255
+                cor = GL.ilumina(posicoes.reshape(-1, 3), normais.reshape(-1, 3),
+                                 difusa.reshape(-1, 3), material, luzes)
+                cores = (cor * 255).astype(np.int64).reshape(-1, 3, 3)
+                luz = ("modula",)
+            else:
+                atributos = np.concatenate([posicoes, normais], axis=2)
+                luz = ("phong", material, luzes)
+
+        tela, cores, uvs, atributos = GL.monta_primitivas(clip, cores, uvs, solid, ccw, atributos)
+        if len(tela):
+            GL.rasteriza_triangulos(tela[:, :, :2], tela[:, :, 2], cores, uvs,
+                                    colors.get('transparency', 0), luz, atributos)
+
+    @staticmethod
+    def monta_primitivas(clip, cores, uvs, solid=True, ccw=True, atributos=None):
+        """Descarta e recorta os triângulos no espaço de recorte antes da rasterização."""
+        # clip é uma matriz (M, 3, 4) com os vértices de cada triângulo no espaço de recorte,
+        # cores (M, 3, 3), uvs (M, 3, 2) ou None e atributos (M, 3, K) ou None, com outros
+        # valores por vértice a interpolar. Retorna os triângulos que sobraram já em
+        # coordenadas de tela (M', 3, 3), junto com suas cores, coordenadas de textura e
+        # atributos.
+        GL.estatisticas['triangulos'] += len(clip)
+        x, y, z, w = clip[:, :, 0], clip[:, :, 1], clip[:, :, 2], clip[:, :, 3]
+
+        # Rejeição trivial: os três vértices do mesmo lado de fora de um plano do volume
+        fora = ((x < -w).all(axis=1) | (x > w).all(axis=1) |
+                (y < -w).all(axis=1) | (y > w).all(axis=1) |
+                (z < -w).all(axis=1) | (z > w).all(axis=1))
+        GL.estatisticas['fora'] += int(fora.sum())
+
+        # Os atributos de cada vértice (posição, cor, textura e extras) são recortados juntos
+        extras = atributos
+        atributos = [clip, cores.astype(np.float64)]
+        if uvs is not None:
+            atributos.append(uvs)
+        if extras is not None:
+            atributos.append(extras)
+        vertices = np.concatenate(atributos, axis=2)[~fora]
+
+        # Recorte no plano próximo (z >= -w) dos triângulos que o atravessam, evitando a
+        # divisão perspectiva de vértices atrás da câmera
+        distancias = vertices[:, :, 2] + vertices[:, :, 3]
+        cruzam = (distancias < 0).any(axis=1)
+        if cruzam.any():
+            GL.estatisticas['recortados'] += int(cruzam.sum())
+            pecas = [vertices[~cruzam]]
+            ordem = [np.nonzero(~cruzam)[0]]
+            for t in np.nonzero(cruzam)[0]:
+                novos = GL.recorta_plano_proximo(vertices[t], distancias[t])
+                pecas.append(novos)
+                ordem.append(np.full(len(novos), t))
+            # Mantém a ordem original dos triângulos, importante para as transparências
+            ordem = np.argsort(np.concatenate(ordem), kind="stable")
+            vertices = np.concatenate(pecas)[ordem]
+
+        forma = vertices.shape
+        tela = np.column_stack(GL.divisao_perspectiva(vertices[:, :, :4].reshape(-1, 4)))
+        tela = tela.reshape(forma[0], 3, 3)
+
+        # Descarte das faces de trás pela área com sinal na tela, onde o eixo y aponta para
+        # baixo, então faces anti-horárias (ccw) têm área negativa
+        if solid and GL.backface_culling:
+            (x0, y0), (x1, y1), (x2, y2) = (tela[:, i, :2].T for i in range(3))
+            area = (x1 - x0) * (y2 - y0) - (x2 - x0) * (y1 - y0)
+            costas = area > 0 if ccw else area < 0
+            GL.estatisticas['costas'] += int(costas.sum())
+            tela, vertices = tela[~costas], vertices[~costas]
+
+        cores = vertices[:, :, 4:7].astype(np.int64)
+        inicio = 7
+        if uvs is not None:
+            uvs = vertices[:, :, 7:9]
+            inicio = 9
+        if extras is not None:
+            extras = vertices[:, :, inicio:]
+        return tela, cores, uvs, extras
+
+    @staticmethod
+    def recorta_plano_proximo(vertices, distancias):
+        """Recorta um triângulo (3, K) no plano próximo, retornando de zero a dois triângulos."""
+        # Sutherland-Hodgman com um único plano, interpolando todos os atributos
+        poligono = []
+        for a in range(3):
+            b = (a + 1) % 3
+            if distancias[a] >= 0:
+                poligono.append(vertices[a])
+            if (distancias[a] >= 0) != (distancias[b] >= 0):
+                t = distancias[a] / (distancias[a] - distancias[b])
+                poligono.append(vertices[a] + t * (vertices[b] - vertices[a]))
+
+        # O polígono resultante (3 ou 4 vértices) vira um leque com a mesma orientação
+        triangulos = [(poligono[0], poligono[k], poligono[k + 1]) for k in range(1, len(poligono) - 1)]
+        if not triangulos:
+            return np.empty((0, 3, vertices.shape[1]))
+        return np.array(triangulos)
 
-        GL.triangleSet2D(vertices, colors, vertex_colors, z_values)
- 
     @staticmethod
     def viewpoint(position, orientation, fieldOfView):
         """Função usada para renderizar (na verdade coletar os dados) de Viewpoint."""
@@ -395,6 +1075,20 @@ class GL:
         # Você precisará usar alguma estrutura de dados pilha para organizar as matrizes.
  
         # O print abaixo é só para vocês verificarem o funcionamento, DEVE SER REMOVIDO.
+        matriz_transformacao = GL.transform_matrix(translation, scale, rotation)
+        matriz_total = GL.matrizes['transform_in'][-1] @ matriz_transformacao
+        GL.matrizes['transform_in'].append(matriz_total)
+
+    @staticmethod
+    def model_matrix(matrix):
+        """Define diretamente a matriz de modelo (mundo) usada pelas próximas geometrias."""
+        # Usada pela lista de desenho da cena, que já guarda as matrizes de mundo prontas;
+        # None volta para a identidade.
+        GL.matrizes['transform_in'] = [np.identity(4) if matrix is None else matrix]
+
+    @staticmethod
+    def transform_matrix(translation, scale, rotation):
+        """Retorna a matriz local (4, 4) de um Transform: translação, rotação e escala."""
         # Matrizes de translação e escala
         matriz_translacao = np.array([
             [1, 0, 0, translation[0]],
@@ -425,9 +1119,23 @@ class GL:
         ])
  
         # Matriz de transformação completa
-        matriz_transformacao = matriz_translacao @ matriz_rotacao @ matriz_escala
-        matriz_total = GL.matrizes['transform_in'][-1] @ matriz_transformacao
-        GL.matrizes['transform_in'].append(matriz_total)
+        return matriz_translacao @ matriz_rotacao @ matriz_escala
+
+    @staticmethod
+    def bounding_box(bboxMin, bboxMax):
+        """Testa se uma caixa envolvente, no sistema de coordenadas atual, pode estar visível."""
+        # Os oito cantos da caixa vão para o espaço de recorte; se todos ficarem do lado de
+        # fora de um mesmo plano do volume de visualização, nada dentro da caixa aparece.
+        cantos = np.array([[x, y, z] for x in (bboxMin[0], bboxMax[0])
+                                     for y in (bboxMin[1], bboxMax[1])
+                                     for z in (bboxMin[2], bboxMax[2])])
+        clip = GL.clip_points(cantos)
+        x, y, z, w = clip[:, 0], clip[:, 1], clip[:, 2], clip[:, 3]
+        fora = ((x < -w).all() or (x > w).all() or (y < -w).all() or (y > w).all() or
+                (z < -w).all() or (z > w).all())
+        if fora:
+            GL.estatisticas['subarvores'] += 1
+        return not fora
  
     @staticmethod
     def transform_out():
@@ -442,7 +1150,8 @@ class GL:
         GL.matrizes['transform_in'].pop()
  
     @staticmethod
-    def triangleStripSet(point, stripCount, colors, vertex_colors=None):
+    def triangleStripSet(point, triangles, colors, vertex_colors=None, solid=True, ccw=True,
+                         normals=None, normal_triangles=None):
         """Função usada para renderizar TriangleStripSet."""
         # https://www.web3d.org/specifications/X3Dv4/ISO-IEC19775-1v4-IS/Part01/components/rendering.html#TriangleStripSet
         # A função triangleStripSet é usada para desenhar tiras de triângulos interconectados,
@@ -456,35 +1165,14 @@ class GL:
         # depois 2, 3 e 4, e assim por diante. Cuidado com a orientação dos vértices, ou seja,
         # todos no sentido horário ou todos no sentido anti-horário, conforme especificado.
  
-        current_index = 0
-        for strip in stripCount:
-            for t in range(strip - 2):
-                idxs = []
-                if t % 2 == 0:
-                    idxs = [current_index + t, current_index + t + 1, current_index + t + 2]
-                else:
-                    idxs = [current_index + t + 1, current_index + t, current_index + t + 2]
- 
-                triangle_vertices = []
-                z_values = []
-                for idx in idxs:
-                    v = point[idx * 3: idx * 3 + 3]
-                    transformed = GL.transform_point(v)
-                    triangle_vertices.extend([transformed[0], transformed[1]])
-                    z_values.append(transformed[2])
- 
-                # Passa cores por vértice se disponíveis
-                if vertex_colors:
-                    vc = vertex_colors[idx * 3: idx * 3 + 9]
-                else:
-                    vc = None
- 
-                GL.triangleSet2D(triangle_vertices, colors, vc, z_values)
- 
-            current_index += strip
- 
+        # Os triângulos das tiras já chegam prontos em triangles, uma matriz (M, 3) calculada
+        # uma única vez na leitura do X3D a partir do stripCount.
+        GL.draw_mesh(point, triangles, colors, vertex_colors, solid=solid, ccw=ccw,
+                     normals=normals, normal_indices=normal_triangles)
+
     @staticmethod
-    def indexedTriangleStripSet(point, index, colors, vertex_colors=None, colorIndex=None):
+    def indexedTriangleStripSet(point, triangles, colors, vertex_colors=None, solid=True,
+                                ccw=True, normals=None, normal_triangles=None):
         """Função usada para renderizar IndexedTriangleStripSet."""
         # https://www.web3d.org/specifications/X3Dv4/ISO-IEC19775-1v4-IS/Part01/components/rendering.html#IndexedTriangleStripSet
         # A função indexedTriangleStripSet é usada para desenhar tiras de triângulos
@@ -501,49 +1189,17 @@ class GL:
  
         # O print abaixo é só para vocês verificarem o funcionamento, DEVE SER REMOVIDO.
        
-        GL.colorPerVertex = True if vertex_colors else False
- 
-        i = 0
-        while i < len(index):
-            strip_indices = []
-            while i < len(index) and index[i] != -1:
-                strip_indices.append(index[i])
-                i += 1
-            i += 1  # Pula o -1
- 
-            # Gera triângulos a partir da strip
-            for j in range(len(strip_indices) - 2):
-                idxs = []
-                if j % 2 == 0:
-                    idxs = [strip_indices[j], strip_indices[j + 1], strip_indices[j + 2]]
-                else:
-                    idxs = [strip_indices[j + 1], strip_indices[j], strip_indices[j + 2]]
- 
-                triangle_vertices = []
-                z_values = []
-                vertex_colors_list = []
-                for idx in idxs:
-                    v = point[idx * 3: idx * 3 + 3]
-                    transformed = GL.transform_point(v)
-                    triangle_vertices.extend([transformed[0], transformed[1]])
-                    z_values.append(transformed[2])
- 
-                    if vertex_colors:
-                        if colorIndex:
-                            color_idx = colorIndex[idx] * 3
-                        else:
-                            color_idx = idx * 3
-                        vc = vertex_colors[color_idx: color_idx + 3]
-                        vertex_colors_list.extend(vc)
- 
-                if GL.colorPerVertex:
-                    GL.triangleSet2D(triangle_vertices, colors, vertex_colors_list, z_values)
-                else:
-                    GL.triangleSet2D(triangle_vertices, colors, None, z_values)
- 
+        GL.colorPerVertex = vertex_colors is not None and len(vertex_colors) > 0
+
+        # Os triângulos das tiras já chegam prontos em triangles, uma matriz (M, 3) calculada
+        # uma única vez na leitura do X3D a partir do index.
+        GL.draw_mesh(point, triangles, colors, vertex_colors if GL.colorPerVertex else None,
+                     solid=solid, ccw=ccw, normals=normals, normal_indices=normal_triangles)
+
     @staticmethod
-    def indexedFaceSet(coord, coordIndex, colorPerVertex, color, colorIndex,
-                       texCoord, texCoordIndex, colors, current_texture):
+    def indexedFaceSet(coord, triangles, colorPerVertex, color, color_triangles,
+                       texCoord, tex_triangles, colors, current_texture, solid=True, ccw=True,
+                       normals=None, normal_triangles=None):
         """Função usada para renderizar IndexedFaceSet."""
         # https://www.web3d.org/specifications/X3Dv4/ISO-IEC19775-1v4-IS/Part01/components/geometry3D.html#IndexedFaceSet
         # A função indexedFaceSet é usada para desenhar malhas de triângulos. Ela funciona de
@@ -569,61 +1225,23 @@ class GL:
         # Os prints abaixo são só para vocês verificarem o funcionamento, DEVE SER REMOVIDO.
  
         if current_texture:
-            GL.current_texture = gpu.GPU.load_texture(current_texture[0])
-            GL.current_texture = np.flipud(GL.current_texture)
+            GL.current_texture = gpu.GPU.get_mipmaps(current_texture)
+            GL.texture_params = current_texture
 
         GL.colorPerVertex = colorPerVertex
         vertex_colors = color if colorPerVertex and color is not None else None
 
-        i = 0
-        while i < len(coordIndex):
-            face_indices = []
-            tex_indices = []
-            while i < len(coordIndex) and coordIndex[i] != -1:
-                face_indices.append(coordIndex[i])
-                if texCoordIndex:
-                    tex_indices.append(texCoordIndex[i])
-                i += 1
-            i += 1 
-
-            for j in range(1, len(face_indices) - 1):
-                idxs = [face_indices[0], face_indices[j + 1], face_indices[j]]
-
-                tex_idxs = [face_indices[0], face_indices[j + 1], face_indices[j]] if tex_indices else None
-
-                triangle_vertices = []
-                z_values = []
-                vertex_colors_list = []
-                tex_coords_list = []
-                for idx, tex_idx in zip(idxs, tex_idxs) if tex_indices else zip(idxs, [None]*3):
-                    v = coord[idx * 3: idx * 3 + 3]
-                    transformed = GL.transform_point(v)
-                    triangle_vertices.extend([transformed[0], transformed[1]])
-                    z_values.append(transformed[2])
-
-                    if GL.colorPerVertex and vertex_colors is not None:
-                        if colorIndex and len(colorIndex) > idx:
-                            color_idx = colorIndex[idx] * 3
-                        else:
-                            color_idx = idx * 3
-                        vc = vertex_colors[color_idx: color_idx + 3]
-                        vertex_colors_list.extend(vc)
-                    else:
-                        vertex_colors_list = None
-
-                    if texCoord and texCoordIndex and tex_idx is not None:
-                        u = texCoord[tex_idx * 2]
-                        v = texCoord[tex_idx * 2 + 1]
-                        v = 1 - v 
-                        tex_coords_list.append((u, v))
-                    else:
-                        tex_coords_list = None
+        # Os polígonos já chegam divididos em triângulos na matriz (M, 3) triangles, calculada
+        # uma única vez na leitura do X3D, assim como os índices de cor (color_triangles) e
+        # de textura (tex_triangles) de cada vértice desses triângulos, quando existirem, e
+        # as normais (normals) com seus índices (normal_triangles). Os leques mantêm a
+        # orientação das faces, então o ccw vale como está.
+        GL.draw_mesh(coord, triangles, colors, vertex_colors, color_triangles,
+                     texCoord, tex_triangles, solid=solid, ccw=ccw,
+                     normals=normals, normal_indices=normal_triangles)
 
-                GL.triangleSet2D(triangle_vertices, colors, vertex_colors_list, z_values, tex_coords_list)
-                
- 
     @staticmethod
-    def box(size, colors):
+    def box(size, colors, solid=True):
         """Função usada para renderizar Boxes."""
         # https://www.web3d.org/specifications/X3Dv4/ISO-IEC19775-1v4-IS/Part01/components/geometry3D.html#Box
         # A função box é usada para desenhar paralelepípedos na cena. O Box é centrada no
@@ -633,15 +1251,11 @@ class GL:
         # essa caixa você vai provavelmente querer tesselar ela em triângulos, para isso
         # encontre os vértices e defina os triângulos.
 
-        # O print abaixo é só para vocês verificarem o funcionamento, DEVE SER REMOVIDO.
-        print("Box : size = {0}".format(size)) # imprime no terminal pontos
-        print("Box : colors = {0}".format(colors)) # imprime no terminal as cores
-
-        # Exemplo de desenho de um pixel branco na coordenada 10, 10
-        gpu.GPU.draw_pixel([10, 10], gpu.GPU.RGB8, [255, 255, 255])  # altera pixel
+        malha = GL.tesselacao("box", tuple(size), 0)
+        GL.draw_mesh(malha[0], malha[1], colors, solid=solid, normals=malha[2])
 
     @staticmethod
-    def sphere(radius, colors):
+    def sphere(radius, colors, solid=True):
         """Função usada para renderizar Esferas."""
         # https://www.web3d.org/specifications/X3Dv4/ISO-IEC19775-1v4-IS/Part01/components/geometry3D.html#Sphere
         # A função sphere é usada para desenhar esferas na cena. O esfera é centrada no
@@ -650,12 +1264,12 @@ class GL:
         # precisar tesselar ela em triângulos, para isso encontre os vértices e defina
         # os triângulos.
 
-        # O print abaixo é só para vocês verificarem o funcionamento, DEVE SER REMOVIDO.
-        print("Sphere : radius = {0}".format(radius)) # imprime no terminal o raio da esfera
-        print("Sphere : colors = {0}".format(colors)) # imprime no terminal as cores
+        nivel = GL.nivel_detalhe(radius)
+        malha = GL.tesselacao("sphere", (radius,), nivel)
+        GL.draw_mesh(malha[0], malha[1], colors, solid=solid, normals=malha[2])
 
     @staticmethod
-    def cone(bottomRadius, height, colors):
+    def cone(bottomRadius, height, colors, side=True, bottom=True, solid=True):
         """Função usada para renderizar Cones."""
         # https://www.web3d.org/specifications/X3Dv4/ISO-IEC19775-1v4-IS/Part01/components/geometry3D.html#Cone
         # A função cone é usada para desenhar cones na cena. O cone é centrado no
@@ -665,13 +1279,12 @@ class GL:
         # Para desenha esse cone você vai precisar tesselar ele em triângulos, para isso
         # encontre os vértices e defina os triângulos.
 
-        # O print abaixo é só para vocês verificarem o funcionamento, DEVE SER REMOVIDO.
-        print("Cone : bottomRadius = {0}".format(bottomRadius)) # imprime no terminal o raio da base do cone
-        print("Cone : height = {0}".format(height)) # imprime no terminal a altura do cone
-        print("Cone : colors = {0}".format(colors)) # imprime no terminal as cores
+        nivel = GL.nivel_detalhe(math.hypot(bottomRadius, height / 2))
+        malha = GL.tesselacao("cone", (bottomRadius, height, side, bottom), nivel)
+        GL.draw_mesh(malha[0], malha[1], colors, solid=solid, normals=malha[2])
 
     @staticmethod
-    def cylinder(radius, height, colors):
+    def cylinder(radius, height, colors, side=True, bottom=True, top=True, solid=True):
         """Função usada para renderizar Cilindros."""
         # https://www.web3d.org/specifications/X3Dv4/ISO-IEC19775-1v4-IS/Part01/components/geometry3D.html#Cylinder
         # A função cylinder é usada para desenhar cilindros na cena. O cilindro é centrado no
@@ -681,10 +1294,179 @@ class GL:
         # Para desenha esse cilindro você vai precisar tesselar ele em triângulos, para isso
         # encontre os vértices e defina os triângulos.
 
-        # O print abaixo é só para vocês verificarem o funcionamento, DEVE SER REMOVIDO.
-        print("Cylinder : radius = {0}".format(radius)) # imprime no terminal o raio do cilindro
-        print("Cylinder : height = {0}".format(height)) # imprime no terminal a altura do cilindro
-        print("Cylinder : colors = {0}".format(colors)) # imprime no terminal as cores
+        nivel = GL.nivel_detalhe(math.hypot(radius, height / 2))
+        malha = GL.tesselacao("cylinder", (radius, height, side, bottom, top), nivel)
+        GL.draw_mesh(malha[0], malha[1], colors, solid=solid, normals=malha[2])
+
+    @staticmethod
+    def nivel_detalhe(raio):
+        """Escolhe o nível de detalhe pelo tamanho na tela da esfera envolvente da primitiva."""
+        # A esfera de raio dado, centrada na origem do sistema de coordenadas atual, é
+        # projetada na tela; o número de segmentos do contorno é escolhido para que cada
+        # aresta tenha por volta de lod_aresta pixels.
+        modelo = GL.matrizes['transform_in'][-1]
+        escala = np.linalg.norm(modelo[:3, :3], axis=0).max()
+        centro = GL.matrizes['viewpoint'] @ modelo @ np.array([0.0, 0.0, 0.0, 1.0])
+        distancia = -centro[2]
+        raio = raio * escala
+        if distancia - raio <= GL.near:
+            return GL.lod_niveis - 1  # câmera dentro ou muito perto da primitiva
+        pixels = raio / distancia * GL.matrizes['perspective'][1, 1] * GL.height / 2
+        segmentos = 2 * math.pi * pixels / GL.lod_aresta
+        if segmentos <= GL.lod_segmentos:
+            return 0
+        return min(math.ceil(math.log2(segmentos / GL.lod_segmentos)), GL.lod_niveis - 1)
+
+    @staticmethod
+    def tesselacao(primitiva, parametros, nivel):
+        """Malha (posições, índices, normais) de uma primitiva, gerada só na primeira vez."""
+        chave = (primitiva, parametros, nivel)
+        if chave not in GL.malhas:
+            segmentos = GL.lod_segmentos * 2 ** nivel
+            partes = []
+            if primitiva == "box":
+                partes.append(GL.malha_caixa(*parametros))
+            elif primitiva == "sphere":
+                raio, = parametros
+                angulos = np.linspace(0, math.pi, segmentos // 2 + 1)
+                perfil = np.stack([raio * np.sin(angulos), raio * np.cos(angulos)], axis=1)
+                perfil[[0, -1], 0] = 0  # polos exatos, para os triângulos degenerados saírem
+                partes.append(GL.malha_revolucao(perfil, segmentos))
+            elif primitiva == "cone":
+                raio, altura, lado, base = parametros
+                if lado:
+                    partes.append(GL.malha_revolucao([[0, altura / 2], [raio, -altura / 2]],
+                                                     segmentos))
+                if base:
+                    partes.append(GL.malha_disco(raio, -altura / 2, segmentos, False))
+            elif primitiva == "cylinder":
+                raio, altura, lado, base, topo = parametros
+                if lado:
+                    partes.append(GL.malha_revolucao([[raio, altura / 2], [raio, -altura / 2]],
+                                                     segmentos))
+                if base:
+                    partes.append(GL.malha_disco(raio, -altura / 2, segmentos, False))
+                if topo:
+                    partes.append(GL.malha_disco(raio, altura / 2, segmentos, True))
+            else:
+                raise Exception(f"Primitiva desconhecida: {primitiva}")
+
+            # Junta as partes deslocando os índices de cada uma
+            posicoes, indices, normais, inicio = [], [], [], 0
+            for pontos, triangulos, normais_parte in partes:
+                posicoes.append(pontos)
+                indices.append(triangulos + inicio)
+                normais.append(normais_parte)
+                inicio += len(pontos)
+            if not partes:
+                posicoes, indices, normais = [np.zeros((0, 3))], [np.zeros((0, 3), np.int64)], [np.zeros((0, 3))]
+            GL.malhas[chave] = (np.concatenate(posicoes), np.concatenate(indices),
+                                np.concatenate(normais))
+        return GL.malhas[chave]
+
+    @staticmethod
+    def malha_caixa(sx, sy, sz):
+        """Paralelepípedo centrado na origem, com quatro vértices próprios por face."""
+        meio = np.array([sx, sy, sz], dtype=np.float64) / 2
+        faces, normais = [], []
+        for eixo in range(3):
+            u, v = (eixo + 1) % 3, (eixo + 2) % 3
+            for sinal in (1, -1):
+                # (u, v, normal) forma base positiva, então o quadrado é anti-horário visto
+                # de fora na face positiva; na negativa a ordem é invertida
+                cantos = [(-1, -1), (1, -1), (1, 1), (-1, 1)][::sinal]
+                for cu, cv in cantos:
+                    ponto = np.zeros(3)
+                    ponto[eixo], ponto[u], ponto[v] = sinal, cu, cv
+                    faces.append(ponto * meio)
+                    normal = np.zeros(3)
+                    normal[eixo] = sinal
+                    normais.append(normal)
+        pontos = np.array(faces)
+        quadrados = np.arange(6)[:, None] * 4
+        indices = np.concatenate([quadrados + [0, 1, 2], quadrados + [0, 2, 3]])
+        return pontos, indices.astype(np.int64), np.array(normais)
+
+    @staticmethod
+    def malha_revolucao(perfil, segmentos):
+        """Superfície de revolução ao redor do eixo Y de um perfil (raio, y) de cima para baixo."""
+        perfil = np.asarray(perfil, dtype=np.float64)
+        angulos = np.linspace(0, 2 * math.pi, segmentos + 1)
+        raio, y = perfil[:, 0:1], perfil[:, 1:2]
+        pontos = np.stack([raio * np.sin(angulos), np.broadcast_to(y, raio.shape[:1] + angulos.shape),
+                           raio * np.cos(angulos)], axis=2).reshape(-1, 3)
+
+        # Normais perpendiculares à tangente do perfil (que desce), apontando para fora
+        tangente = np.gradient(perfil, axis=0)
+        normal = np.stack([-tangente[:, 1], tangente[:, 0]], axis=1)
+        normal /= np.linalg.norm(normal, axis=1, keepdims=True)
+        normais = np.stack([normal[:, 0:1] * np.sin(angulos),
+                            np.broadcast_to(normal[:, 1:2], raio.shape[:1] + angulos.shape),
+                            normal[:, 0:1] * np.cos(angulos)], axis=2).reshape(-1, 3)
+
+        # Cada quadrilátero (a, b) em cima e (c, d) embaixo vira dois triângulos anti-horários
+        # vistos de fora; os que degeneram nos polos (raio zero) são descartados
+        colunas = segmentos + 1
+        linha, coluna = np.meshgrid(np.arange(len(perfil) - 1), np.arange(segmentos), indexing="ij")
+        a = (linha * colunas + coluna).reshape(-1)
+        b, c = a + 1, a + colunas
+        d = c + 1
+        indices = np.concatenate([np.stack([a, c, d], axis=1), np.stack([a, d, b], axis=1)])
+        vertices = pontos[indices]
+        degenerado = ((vertices[:, 0] == vertices[:, 1]).all(axis=1) |
+                      (vertices[:, 1] == vertices[:, 2]).all(axis=1) |
+                      (vertices[:, 0] == vertices[:, 2]).all(axis=1))
+        return pontos, indices[~degenerado].astype(np.int64), normais
+
+    @staticmethod
+    def malha_disco(raio, y, segmentos, para_cima):
+        """Tampa circular no plano y, voltada para +Y (para_cima) ou para -Y."""
+        angulos = np.linspace(0, 2 * math.pi, segmentos, endpoint=False)
+        pontos = np.zeros((segmentos + 1, 3))
+        pontos[1:, 0] = raio * np.sin(angulos)
+        pontos[1:, 1] = y
+        pontos[1:, 2] = raio * np.cos(angulos)
+        pontos[0, 1] = y
+        borda = np.arange(1, segmentos + 1)
+        proximo = np.roll(borda, -1)
+        centro = np.zeros(segmentos, dtype=np.int64)
+        if para_cima:
+            indices = np.stack([centro, borda, proximo], axis=1)
+        else:
+            indices = np.stack([centro, proximo, borda], axis=1)
+        normais = np.zeros((segmentos + 1, 3))
+        normais[:, 1] = 1 if para_cima else -1
+        return pontos, indices.astype(np.int64), normais
+
+    @staticmethod
+    def imageTexture(url, repeatS, repeatT, minificationFilter="DEFAULT",
+                     magnificationFilter="DEFAULT", generateMipMaps=True):
+        """Resolve a textura de um ImageTexture para uma referência no cache da GPU."""
+        # https://www.web3d.org/specifications/X3Dv4/ISO-IEC19775-1v4-IS/Part01/components/texturing.html#ImageTexture
+        # https://www.web3d.org/specifications/X3Dv4/ISO-IEC19775-1v4-IS/Part01/components/texturing.html#TextureProperties
+        # Cada filtro do X3D vira um par (filtro dos texels, filtro entre níveis de mipmap):
+        # o texel mais próximo ("nearest") ou a média dos vizinhos ("linear"), e nenhum
+        # mipmap (None, só o nível 0), o nível mais próximo ou a mistura dos dois mais
+        # próximos. Sem generateMipMaps a textura é sempre amostrada no nível 0.
+        filtros = {
+            "NEAREST_PIXEL": ("nearest", None),
+            "NEAREST_PIXEL_NEAREST_MIPMAP": ("nearest", "nearest"),
+            "NEAREST_PIXEL_AVG_MIPMAP": ("nearest", "linear"),
+            "AVG_PIXEL": ("linear", None),
+            "AVG_PIXEL_NEAREST_MIPMAP": ("linear", "nearest"),
+            "AVG_PIXEL_AVG_MIPMAP": ("linear", "linear"),
+            "FASTEST": ("nearest", None),
+            "NICEST": ("linear", "linear"),
+        }
+        filtro_min, mipmap = filtros.get(minificationFilter, filtros[GL.texture_filter])
+        filtro_mag, _ = filtros.get(magnificationFilter, filtros[GL.texture_filter])
+        if not generateMipMaps:
+            mipmap = None
+
+        if url:
+            return gpu.GPU.texture_handle(url[0], filtro_min=filtro_min, filtro_mag=filtro_mag,
+                                          mipmap=mipmap, repeatS=repeatS, repeatT=repeatT)
+        return None
 
     @staticmethod
     def navigationInfo(headlight):
@@ -696,11 +1478,11 @@ class GL:
         # A luz headlight deve ser direcional, ter intensidade = 1, cor = (1 1 1),
         # ambientIntensity = 0,0 e direção = (0 0 −1).
 
-        # O print abaixo é só para vocês verificarem o funcionamento, DEVE SER REMOVIDO.
-        print("NavigationInfo : headlight = {0}".format(headlight)) # imprime no terminal
+        if headlight:
+            GL.adiciona_luz([1, 1, 1], [0, 0, 0], direcao=[0, 0, -1])
 
     @staticmethod
-    def directionalLight(ambientIntensity, color, intensity, direction):
+    def directionalLight(ambientIntensity, color, intensity, direction, on=True):
         """Luz direcional ou paralela."""
         # https://www.web3d.org/specifications/X3Dv4/ISO-IEC19775-1v4-IS/Part01/components/lighting.html#DirectionalLight
         # Define uma fonte de luz direcional que ilumina ao longo de raios paralelos
@@ -709,14 +1491,15 @@ class GL:
         # que emana da fonte de luz no sistema de coordenadas local. A luz é emitida ao
         # longo de raios paralelos de uma distância infinita.
 
-        # O print abaixo é só para vocês verificarem o funcionamento, DEVE SER REMOVIDO.
-        print("DirectionalLight : ambientIntensity = {0}".format(ambientIntensity))
-        print("DirectionalLight : color = {0}".format(color)) # imprime no terminal
-        print("DirectionalLight : intensity = {0}".format(intensity)) # imprime no terminal
-        print("DirectionalLight : direction = {0}".format(direction)) # imprime no terminal
+        if on:
+            vista = GL.matrizes['viewpoint'] @ GL.matrizes['transform_in'][-1]
+            direcao = vista[:3, :3] @ np.asarray(direction, dtype=np.float64)
+            GL.adiciona_luz(np.multiply(color, intensity), np.multiply(color, ambientIntensity),
+                            direcao=direcao / np.linalg.norm(direcao))
 
     @staticmethod
-    def pointLight(ambientIntensity, color, intensity, location):
+    def pointLight(ambientIntensity, color, intensity, location, radius=100,
+                   attenuation=(1, 0, 0), on=True):
         """Luz pontual."""
         # https://www.web3d.org/specifications/X3Dv4/ISO-IEC19775-1v4-IS/Part01/components/lighting.html#PointLight
         # Fonte de luz pontual em um local 3D no sistema de coordenadas local. Uma fonte
@@ -725,14 +1508,76 @@ class GL:
         # a geometria em um raio de sua localização. O campo do raio deve ser maior ou igual a
         # zero. A iluminação do nó PointLight diminui com a distância especificada.
 
-        # O print abaixo é só para vocês verificarem o funcionamento, DEVE SER REMOVIDO.
-        print("PointLight : ambientIntensity = {0}".format(ambientIntensity))
-        print("PointLight : color = {0}".format(color)) # imprime no terminal
-        print("PointLight : intensity = {0}".format(intensity)) # imprime no terminal
-        print("PointLight : location = {0}".format(location)) # imprime no terminal
+        if on:
+            vista = GL.matrizes['viewpoint'] @ GL.matrizes['transform_in'][-1]
+            posicao = vista @ np.append(np.asarray(location, dtype=np.float64), 1)
+            escala = np.linalg.norm(vista[:3, :3], axis=0).max()  # o raio segue a escala
+            GL.adiciona_luz(np.multiply(color, intensity), np.multiply(color, ambientIntensity),
+                            posicao=posicao[:3], raio=radius * escala, atenuacao=attenuation)
+
+    @staticmethod
+    def adiciona_luz(cor, ambiente, direcao=None, posicao=None, raio=math.inf,
+                     atenuacao=(1, 0, 0)):
+        """Registra uma luz do quadro, com direção ou posição no sistema da câmera."""
+        GL.luzes.append({
+            'cor': cor,
+            'ambiente': ambiente,
+            'pontual': posicao is not None,
+            'direcao': [0, 0, 0] if direcao is None else direcao,
+            'posicao': [0, 0, 0] if posicao is None else posicao,
+            'raio': raio,
+            'atenuacao': atenuacao,
+        })
+        GL.arranjo_luzes = None
 
     @staticmethod
-    def fog(visibilityRange, color):
+    def luzes_do_quadro():
+        """Luzes do quadro em matrizes, uma linha por luz, ou None se não houver luz acesa."""
+        if GL.arranjo_luzes is None and GL.luzes:
+            GL.arranjo_luzes = {chave: np.array([luz[chave] for luz in GL.luzes], dtype=np.float64)
+                                for chave in GL.luzes[0]}
+            GL.arranjo_luzes['regiao'] = GL.regioes_das_luzes(GL.arranjo_luzes)
+        return GL.arranjo_luzes
+
+    @staticmethod
+    def regioes_das_luzes(luzes):
+        """Retângulo (min_x, max_x, min_y, max_y) do super buffer que cada luz pode iluminar."""
+        # As luzes direcionais e as pontuais de raio infinito cobrem a tela toda. As demais
+        # são limitadas pela esfera de influência, projetando os oito cantos da caixa que a
+        # envolve; esferas que cruzam o plano próximo também cobrem a tela toda e as que
+        # estão inteiras atrás dele não cobrem nada (retângulo vazio).
+        regioes = np.tile([0.0, GL.super_width - 1, 0.0, GL.super_height - 1], (len(luzes['cor']), 1))
+        limitadas = (luzes['pontual'] > 0) & np.isfinite(luzes['raio'])
+        if not limitadas.any():
+            return regioes
+
+        centros, raios = luzes['posicao'][limitadas], luzes['raio'][limitadas]
+        sinais = np.array([[x, y, z] for x in (-1, 1) for y in (-1, 1) for z in (-1, 1)])
+        cantos = centros[:, np.newaxis] + raios[:, np.newaxis, np.newaxis] * sinais
+        homogeneos = np.concatenate((cantos, np.ones(cantos.shape[:2] + (1,))), axis=2)
+        homogeneos = homogeneos @ GL.matrizes['perspective'].T
+        frente = (cantos[:, :, 2] < -GL.near).all(axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ndc = homogeneos[:, :, :2] / homogeneos[:, :, 3:]
+        x = (ndc[:, :, 0] + 1) * 0.5 * GL.super_width
+        y = (1 - ndc[:, :, 1]) * 0.5 * GL.super_height
+
+        projetadas = regioes[limitadas]
+        projetadas[frente] = np.column_stack((np.floor(x.min(axis=1)), np.ceil(x.max(axis=1)),
+                                              np.floor(y.min(axis=1)), np.ceil(y.max(axis=1))))[frente]
+        projetadas[centros[:, 2] - raios >= -GL.near] = [1, 0, 1, 0]
+        regioes[limitadas] = projetadas
+        return regioes
+
+    @staticmethod
+    def seleciona_luzes(luzes, mascara):
+        """Recorta as matrizes das luzes do quadro para as luzes marcadas na máscara."""
+        if mascara.all():
+            return luzes
+        return {chave: valores[mascara] for chave, valores in luzes.items()}
+
+    @staticmethod
+    def fog(visibilityRange, color, fogType="LINEAR"):
         """Névoa."""
         # https://www.web3d.org/specifications/X3Dv4/ISO-IEC19775-1v4-IS/Part01/components/environmentalEffects.html#Fog
         # O nó Fog fornece uma maneira de simular efeitos atmosféricos combinando objetos
@@ -741,11 +1586,46 @@ class GL:
         # sistema de coordenadas local na qual os objetos são totalmente obscurecidos
         # pela névoa. Os objetos localizados fora de visibilityRange do visualizador são
         # desenhados com uma cor de cor constante. Objetos muito próximos do visualizador
-        # são muito pouco misturados com a cor do nevoeiro.
+        # são muito pouco misturados com a cor do nevoeiro. Um visibilityRange de 0
+        # desliga a névoa.
 
-        # O print abaixo é só para vocês verificarem o funcionamento, DEVE SER REMOVIDO.
-        print("Fog : color = {0}".format(color)) # imprime no terminal
-        print("Fog : visibilityRange = {0}".format(visibilityRange))
+        if visibilityRange > 0:
+            vista = GL.matrizes['viewpoint'] @ GL.matrizes['transform_in'][-1]
+            escala = np.linalg.norm(vista[:3, :3], axis=0).max()  # o alcance segue a escala
+            GL.nevoa = (visibilityRange * escala, np.asarray(color, dtype=np.float64) * 255,
+                        fogType)
+
+    @staticmethod
+    def aplica_nevoa():
+        """Mistura a cor da névoa no super buffer conforme a distância de cada amostra."""
+        # Com a projeção perspectiva, z_ndc = (A*z + B) / -z, então a profundidade da amostra
+        # no sistema da câmera é z = -B / (z_ndc + A), e a distância ao observador é -z vezes
+        # o comprimento do raio que passa pelo pixel. O fundo (profundidade 1) fica sem névoa.
+        alcance, cor, tipo = GL.nevoa
+        z_buffer = gpu.GPU.get_depth_buffer()
+        profundidade = z_buffer.astype(np.float64)
+        if z_buffer.dtype == np.uint16:
+            profundidade /= 65535
+        geometria = profundidade < 1
+
+        projecao = GL.matrizes['perspective']
+        a, b = projecao[2, 2], projecao[2, 3]
+        x_ndc = 2 * np.arange(GL.super_width) / GL.super_width - 1
+        y_ndc = 1 - 2 * np.arange(GL.super_height) / GL.super_height
+        raio = np.sqrt(1 + (x_ndc[np.newaxis] / projecao[0, 0]) ** 2 +
+                       (y_ndc[:, np.newaxis] / projecao[1, 1]) ** 2)
+        with np.errstate(divide='ignore'):
+            distancia = b / (2 * profundidade - 1 + a) * raio
+
+        # Fator de visibilidade f: 1 sem névoa e 0 totalmente encoberto pela névoa
+        if tipo == "EXPONENTIAL":
+            with np.errstate(divide='ignore', over='ignore'):
+                f = np.where(distancia < alcance, np.exp(-distancia / (alcance - distancia)), 0.0)
+        else:  # LINEAR
+            f = (alcance - distancia) / alcance
+        f = np.clip(np.where(geometria, f, 1.0), 0, 1)[:, :, np.newaxis]
+
+        GL.super_buffer[:] = (f * GL.super_buffer + (1 - f) * cor).astype(np.int64)
 
     @staticmethod
     def timeSensor(cycleInterval, loop):
@@ -10,6 +10,7 @@ Data: 31 de Agosto de 2020
 """
 
 import os           # Para rotinas do sistema operacional
+from collections import OrderedDict  # Para o cache de texturas (LRU)
 
 # Numpy
 import numpy as np
@@ -24,6 +25,21 @@ class FrameBuffer:
         """Iniciando propriedades do FramBuffer."""
         self.color = np.empty(0)
         self.depth = np.empty(0)
+        self.attachments = {}  # canais de cor adicionais (COLOR_ATTACHMENT1, ...)
+
+
+class TextureHandle:
+    """Referência para uma textura guardada no cache de texturas da GPU."""
+
+    def __init__(self, path, filtro_min="nearest", filtro_mag="nearest", mipmap=None,
+                 repeatS=True, repeatT=True):
+        """Guarda o caminho resolvido da imagem e os parâmetros de amostragem da textura."""
+        self.path = path
+        self.filtro_min = filtro_min  # filtro dos texels na minificação: "nearest" ou "linear"
+        self.filtro_mag = filtro_mag  # filtro dos texels na magnificação: "nearest" ou "linear"
+        self.mipmap = mipmap          # entre níveis na minificação: None (só o 0), "nearest" ou "linear"
+        self.repeatS = repeatS        # repete (True) ou prende na borda (False) em s
+        self.repeatT = repeatT        # repete (True) ou prende na borda (False) em t
 
 
 class GPU:
@@ -36,17 +52,25 @@ class GPU:
 
     RGB8 = 0b001  # Valores para Vermelho, Verde, Azul de 8bits cada (0-255)
     RGBA8 = 0b010  # Valores para Vermelho, Verde, Azul e Transpareência de 8bits cada (0-255)
+    RGB32F = 0b011  # Três valores em float de 32bits cada (normais, posições, ...)
+    R32I = 0b100  # Um valor inteiro de 32bits (identificadores, como o de material)
     DEPTH_COMPONENT16 = 0b101  # Valores para Profundidade de 16bits cada (0-65535)
     DEPTH_COMPONENT32F = 0b110  # Valores para Profundidade de 32bits em float
 
     COLOR_ATTACHMENT = 0  # Para FrameBuffer Object identificar memória de imagem de cores
     DEPTH_ATTACHMENT = 1  # Para FrameBuffer Object identificar memória de imagem de profundidade
+    COLOR_ATTACHMENT1 = 2  # Canais de cor adicionais, para desenhar em vários alvos (MRT)
+    COLOR_ATTACHMENT2 = 3
+    COLOR_ATTACHMENT3 = 4
 
     # Atributos estáticos
     image_file = None
     frame_buffer = None
     path = "."
 
+    # Memória máxima usada pelo cache de texturas (em bytes)
+    texture_memory = 256 * 1024 * 1024
+
     def __init__(self, image_file, path):
         """Define o nome do arquivo para caso se salvar o framebuffer."""
         GPU.image_file = image_file
@@ -65,6 +89,10 @@ class GPU:
         # Caminho para arquivos adicionais, como texturas
         GPU.path = path
 
+        # Cache de texturas: (caminho, data de modificação) -> cadeia de mipmaps da imagem
+        GPU.texture_cache = OrderedDict()
+        GPU.texture_cache_size = 0
+
     @staticmethod
     def gen_framebuffers(size):
         """Gera posições para FrameBuffers."""
@@ -89,15 +117,26 @@ class GPU:
     @staticmethod
     def framebuffer_storage(position, attachment, mode, width, height):
         """Aloca o FrameBuffer especificado."""
-        if attachment == GPU.COLOR_ATTACHMENT:
+        if attachment in (GPU.COLOR_ATTACHMENT, GPU.COLOR_ATTACHMENT1, GPU.COLOR_ATTACHMENT2,
+                          GPU.COLOR_ATTACHMENT3):
             if mode == GPU.RGB8:
                 dtype = np.uint8
                 depth = 3
+            elif mode == GPU.RGB32F:
+                dtype = np.float32
+                depth = 3
+            elif mode == GPU.R32I:
+                dtype = np.int32
+                depth = 1
             else:  # mode == GPU.RGBA8:
                 dtype = np.uint8
                 depth = 4
             # Aloca espaço definindo todos os valores como 0 (imagem preta)
-            GPU.frame_buffer[position].color = np.zeros((height, width, depth), dtype=dtype)
+            memoria = np.zeros((height, width, depth), dtype=dtype)
+            if attachment == GPU.COLOR_ATTACHMENT:
+                GPU.frame_buffer[position].color = memoria
+            else:
+                GPU.frame_buffer[position].attachments[attachment] = memoria
         elif attachment == GPU.DEPTH_ATTACHMENT:
             if mode == GPU.DEPTH_COMPONENT16:
                 dtype = np.uint16
@@ -105,8 +144,9 @@ class GPU:
             else:  # mode == GPU.DEPTH_COMPONENT32F:
                 dtype = np.float32
                 depth = 1
-            # Aloca espaço definindo todos os valores como 1 (profundidade máxima)
-            GPU.frame_buffer[position].depth = np.ones((height, width, depth), dtype=dtype)
+            # Aloca espaço definindo todos os valores como a profundidade máxima
+            GPU.frame_buffer[position].depth = np.full((height, width, depth),
+                                                       GPU.depth_value(1.0, dtype), dtype=dtype)
 
     @staticmethod
     def clear_color(color):
@@ -124,7 +164,38 @@ class GPU:
         if GPU.frame_buffer[GPU.draw_framebuffer].color.size != 0:
             GPU.frame_buffer[GPU.draw_framebuffer].color[:] = GPU.clear_color_val
         if GPU.frame_buffer[GPU.draw_framebuffer].depth.size != 0:
-            GPU.frame_buffer[GPU.draw_framebuffer].depth[:] = GPU.clear_depth_val
+            depth = GPU.frame_buffer[GPU.draw_framebuffer].depth
+            depth.fill(GPU.depth_value(GPU.clear_depth_val, depth.dtype))
+        for memoria in GPU.frame_buffer[GPU.draw_framebuffer].attachments.values():
+            memoria.fill(0)
+
+    @staticmethod
+    def depth_value(z, dtype):
+        """Converte profundidades em [0, 1] para o formato do canal de profundidade."""
+        # DEPTH_COMPONENT16 guarda a profundidade em ponto fixo (0-65535) e
+        # DEPTH_COMPONENT32F em float, como numa GPU
+        if np.dtype(dtype) == np.uint16:
+            return np.rint(np.clip(z, 0.0, 1.0) * 65535).astype(np.uint16)
+        return np.asarray(z, dtype=np.float32)
+
+    @staticmethod
+    def get_depth_buffer():
+        """Retorna a memória de profundidade do Framebuffer de desenho, como matriz (H, W)."""
+        return GPU._attachment(GPU.draw_framebuffer, GPU.DEPTH_COMPONENT32F)[:, :, 0]
+
+    @staticmethod
+    def get_attachment(position, attachment):
+        """Retorna a memória de um canal (attachment) de um Framebuffer, como (H, W, canais)."""
+        fbo = GPU.frame_buffer[position]
+        if attachment == GPU.COLOR_ATTACHMENT:
+            memoria = fbo.color
+        elif attachment == GPU.DEPTH_ATTACHMENT:
+            memoria = fbo.depth
+        else:
+            memoria = fbo.attachments.get(attachment, np.empty(0))
+        if memoria.size == 0:
+            raise Exception(f"Frame buffer {position} não alocado com o canal {attachment}")
+        return memoria
 
     @staticmethod
     def draw_pixel(coord, mode, data):
@@ -221,6 +292,81 @@ class GPU:
             # Retorna valor dos dados do Framebuffer
             return data
 
+    @staticmethod
+    def draw_pixels(coords, mode, data):
+        """Define o valor de vários pixels no framebuffer de uma só vez."""
+        # coords é um vetor (N, 2) com as posições [x, y] e data um vetor (N, canais)
+        coords = np.asarray(coords, dtype=np.intp).reshape(-1, 2)
+        buffer = GPU._attachment(GPU.draw_framebuffer, mode)
+        GPU._verifica_coords(coords, buffer.shape, "escrita")
+        data = GPU._verifica_dados(data, mode, (len(coords),))
+        buffer[coords[:, 1], coords[:, 0]] = data
+
+    @staticmethod
+    def read_pixels(coords, mode):
+        """Retorna o valor de vários pixels no framebuffer de uma só vez."""
+        coords = np.asarray(coords, dtype=np.intp).reshape(-1, 2)
+        buffer = GPU._attachment(GPU.read_framebuffer, mode)
+        GPU._verifica_coords(coords, buffer.shape, "leitura")
+        return buffer[coords[:, 1], coords[:, 0]]
+
+    @staticmethod
+    def write_span(coord, mode, data):
+        """Define os valores de uma sequência horizontal de pixels a partir de [x, y]."""
+        data = np.asarray(data)
+        GPU.write_rect(coord, mode, data.reshape((1,) + data.shape))
+
+    @staticmethod
+    def write_rect(coord, mode, data):
+        """Define os valores de um retângulo de pixels com canto superior esquerdo em [x, y]."""
+        # data é uma matriz (altura, largura, canais) com os valores a serem gravados
+        data = np.asarray(data)
+        buffer = GPU._attachment(GPU.draw_framebuffer, mode)
+        if data.size == 0:
+            return
+        altura, largura = data.shape[0], data.shape[1]
+        cantos = np.array([coord, [coord[0] + largura - 1, coord[1] + altura - 1]])
+        GPU._verifica_coords(cantos, buffer.shape, "escrita")
+        data = GPU._verifica_dados(data, mode, (altura, largura))
+        buffer[coord[1]:coord[1] + altura, coord[0]:coord[0] + largura] = data
+
+    @staticmethod
+    def _attachment(position, mode):
+        """Retorna a memória do Framebuffer correspondente ao modo informado."""
+        if mode in (GPU.RGB8, GPU.RGBA8):  # cores
+            if GPU.frame_buffer[position].color.size == 0:
+                raise Exception(f"Frame buffer {position} não alocado com o canal de cor")
+            return GPU.frame_buffer[position].color
+        if mode in (GPU.DEPTH_COMPONENT16, GPU.DEPTH_COMPONENT32F):  # profundidade
+            if GPU.frame_buffer[position].depth.size == 0:
+                raise Exception(f"Frame buffer {position} não alocado com o canal de profundidade")
+            return GPU.frame_buffer[position].depth
+        raise Exception(f"Modo inválido de acesso ao Frame buffer ({mode})")
+
+    @staticmethod
+    def _verifica_coords(coords, fb_dim, acesso):
+        """Verifica de uma só vez se todas as posições estão dentro do Framebuffer."""
+        fora = (coords[:, 0] < 0) | (coords[:, 0] >= fb_dim[1]) | \
+               (coords[:, 1] < 0) | (coords[:, 1] >= fb_dim[0])
+        if np.any(fora):
+            coord = coords[np.argmax(fora)]
+            raise Exception(f"Acesso irregular de {acesso} na posição [{coord[0]}, {coord[1]}] do Framebuffer {fb_dim[1], fb_dim[0]}")
+
+    @staticmethod
+    def _verifica_dados(data, mode, forma):
+        """Verifica de uma só vez o tamanho e a faixa dos dados a serem gravados."""
+        data = np.asarray(data)
+        if mode in (GPU.RGB8, GPU.RGBA8):  # cores
+            if data.shape != forma + (mode+2,) or not np.issubdtype(data.dtype, np.number) or \
+               np.any(data < 0) or np.any(data > 255):
+                raise Exception(f"Valores do Frame buffer devem estar em um vetor de dimensão [{mode+2}] ser inteiros e estar entre 0 e 255")
+        else:  # profundidade
+            if data.shape == forma:
+                data = data[..., np.newaxis]
+            if data.shape != forma + (1,) or not np.issubdtype(data.dtype, np.number):
+                raise Exception(f"Valores do Frame buffer devem ser um vetor com um único valor numérico por pixel: {data.shape}")
+        return data
+
     @staticmethod
     def save_image():
         """Método para salvar a imagem do framebuffer em um arquivo."""
@@ -242,6 +388,54 @@ class GPU:
         matriz = np.array(imagem)
         return matriz
 
+    @staticmethod
+    def texture_handle(textura, **parametros):
+        """Retorna uma referência para a textura, que será lida sob demanda pelo cache."""
+        return TextureHandle(os.path.realpath(os.path.join(GPU.path, textura)), **parametros)
+
+    @staticmethod
+    def get_texture(handle):
+        """Retorna a matriz da textura (nível 0 do mipmap), lendo o arquivo só se preciso."""
+        return GPU.get_mipmaps(handle)[0]
+
+    @staticmethod
+    def get_mipmaps(handle):
+        """Retorna a cadeia de mipmaps da textura, lendo o arquivo só se não estiver no cache."""
+        # A chave inclui a data de modificação para que arquivos alterados sejam relidos
+        chave = (handle.path, os.path.getmtime(handle.path))
+        if chave in GPU.texture_cache:
+            GPU.texture_cache.move_to_end(chave)  # marca como usada mais recentemente
+            return GPU.texture_cache[chave]
+
+        # Guarda a imagem uma única vez, contígua e já na orientação usada na amostragem
+        matriz = np.ascontiguousarray(np.flipud(GPU.load_texture(handle.path)), dtype=np.uint8)
+        if matriz.ndim == 2:  # imagens em tons de cinza viram RGB
+            matriz = np.repeat(matriz[:, :, np.newaxis], 3, axis=2)
+        niveis = GPU.gera_mipmaps(matriz)
+        GPU.texture_cache[chave] = niveis
+        GPU.texture_cache_size += sum(nivel.nbytes for nivel in niveis)
+
+        # Remove as texturas usadas há mais tempo até caber na memória disponível
+        while GPU.texture_cache_size > GPU.texture_memory and len(GPU.texture_cache) > 1:
+            _, antiga = GPU.texture_cache.popitem(last=False)
+            GPU.texture_cache_size -= sum(nivel.nbytes for nivel in antiga)
+
+        return niveis
+
+    @staticmethod
+    def gera_mipmaps(matriz):
+        """Gera a cadeia de mipmaps da imagem, reduzindo pela metade até chegar em 1x1."""
+        niveis = [matriz]
+        while max(matriz.shape[:2]) > 1:
+            # Dimensões ímpares repetem a última linha/coluna antes da média 2x2
+            altura, largura = matriz.shape[:2]
+            pad = np.pad(matriz, ((0, altura % 2), (0, largura % 2), (0, 0)), mode="edge")
+            pad = pad.astype(np.float32)
+            media = (pad[0::2, 0::2] + pad[1::2, 0::2] + pad[0::2, 1::2] + pad[1::2, 1::2]) / 4
+            matriz = np.ascontiguousarray(np.rint(media), dtype=np.uint8)
+            niveis.append(matriz)
+        return niveis
+
     @staticmethod
     def get_frame_buffer():
         """Retorna o Framebuffer atual para leitura."""
@@ -35,6 +35,7 @@ class Renderizador:
         self.image_file = "tela.png"
         self.scene = None
         self.framebuffers = {}
+        self.depth_format = gpu.GPU.DEPTH_COMPONENT32F  # ou gpu.GPU.DEPTH_COMPONENT16
 
     def setup(self):
         """Configura o sistema para a renderização."""
@@ -64,18 +65,34 @@ class Renderizador:
             self.height
         )
 
-        # Descomente as seguintes linhas se for usar um Framebuffer para profundidade
-        # gpu.GPU.framebuffer_storage(
-        #     self.framebuffers["FRONT"],
-        #     gpu.GPU.DEPTH_ATTACHMENT,
-        #     gpu.GPU.DEPTH_COMPONENT32F,
-        #     self.width,
-        #     self.height
-        # )
+        # Memória de Framebuffer para profundidade, na resolução do supersampling, já que
+        # o teste de profundidade é feito amostra a amostra antes do resolve
+        gpu.GPU.framebuffer_storage(
+            self.framebuffers["FRONT"],
+            gpu.GPU.DEPTH_ATTACHMENT,
+            self.depth_format,
+            self.width * gl.GL.supersampling_factor,
+            self.height * gl.GL.supersampling_factor
+        )
+
+        # G-buffer do sombreamento adiado, também na resolução do supersampling e usando
+        # a profundidade acima: albedo, normal e identificador de material por amostra
+        if gl.GL.deferred:
+            for attachment, mode in ((gpu.GPU.COLOR_ATTACHMENT1, gpu.GPU.RGB32F),
+                                     (gpu.GPU.COLOR_ATTACHMENT2, gpu.GPU.RGB32F),
+                                     (gpu.GPU.COLOR_ATTACHMENT3, gpu.GPU.R32I)):
+                gpu.GPU.framebuffer_storage(
+                    self.framebuffers["FRONT"],
+                    attachment,
+                    mode,
+                    self.width * gl.GL.supersampling_factor,
+                    self.height * gl.GL.supersampling_factor
+                )
     
         # Opções:
         # - COLOR_ATTACHMENT: alocações para as cores da imagem renderizada
         # - DEPTH_ATTACHMENT: alocações para as profundidades da imagem renderizada
+        # - COLOR_ATTACHMENT1 a 3: canais extras, para desenhar em vários alvos (G-buffer)
         # Obs: Você pode chamar duas vezes a rotina com cada tipo de buffer.
 
         # Tipos de dados:
@@ -83,6 +100,8 @@ class Renderizador:
         # - RGBA8: Para canais de cores (Vermelho, Verde, Azul, Transparência) 8bits cada (0-255)
         # - DEPTH_COMPONENT16: Para canal de Profundidade de 16bits (half-precision) (0-65535)
         # - DEPTH_COMPONENT32F: Para canal de Profundidade de 32bits (single-precision) (float)
+        # - RGB32F: Para três canais em float de 32bits (normais, albedo, ...)
+        # - R32I: Para um canal inteiro de 32bits (identificadores)
 
         # Define cor que ira apagar o FrameBuffer quando clear_buffer() invocado
         gpu.GPU.clear_color([0, 0, 0])
@@ -101,9 +120,14 @@ class Renderizador:
         # Limpa o frame buffers atual
         gpu.GPU.clear_buffer()
 
+        # Limpa o super buffer usado na rasterização (a profundidade já foi limpa acima)
+        gl.GL.clear_buffers()
+
         # Recursos que podem ser úteis:
         # Define o valor do pixel no framebuffer: draw_pixel(coord, mode, data)
         # Retorna o valor do pixel no framebuffer: read_pixel(coord, mode)
+        # Versões em lote: draw_pixels(coords, mode, data), read_pixels(coords, mode),
+        # write_span(coord, mode, data) e write_rect(coord, mode, data)
 
     def pos(self):
         """Rotinas pós renderização."""
@@ -113,6 +137,16 @@ class Renderizador:
         # ao final da renderização de um frame. Como por exemplo, executar
         # downscaling da imagem.
 
+        # Rasteriza os triângulos acumulados no modo por tiles (se habilitado)
+        gl.GL.flush()
+
+        # Contagens de descarte e recorte do quadro (com --stats)
+        if gl.GL.mostra_estatisticas:
+            gl.GL.imprime_estatisticas()
+
+        # Resolve o supersampling do quadro inteiro para o Framebuffer
+        gl.GL.resolve()
+
         # Método para a troca dos buffers (NÃO IMPLEMENTADO)
         # Esse método será utilizado na fase de implementação de animações
         gpu.GPU.swap_buffers()
@@ -128,9 +162,13 @@ class Renderizador:
         x3d.X3D.renderer["Viewpoint"] = gl.GL.viewpoint
         x3d.X3D.renderer["Transform_in"] = gl.GL.transform_in
         x3d.X3D.renderer["Transform_out"] = gl.GL.transform_out
+        x3d.X3D.renderer["Transform_matrix"] = gl.GL.transform_matrix
+        x3d.X3D.renderer["Model_matrix"] = gl.GL.model_matrix
+        x3d.X3D.renderer["BoundingBox"] = gl.GL.bounding_box
         x3d.X3D.renderer["TriangleStripSet"] = gl.GL.triangleStripSet
         x3d.X3D.renderer["IndexedTriangleStripSet"] = gl.GL.indexedTriangleStripSet
         x3d.X3D.renderer["IndexedFaceSet"] = gl.GL.indexedFaceSet
+        x3d.X3D.renderer["ImageTexture"] = gl.GL.imageTexture
         x3d.X3D.renderer["Box"] = gl.GL.box
         x3d.X3D.renderer["Sphere"] = gl.GL.sphere
         x3d.X3D.renderer["Cone"] = gl.GL.cone
@@ -161,6 +199,9 @@ class Renderizador:
         parser.add_argument("-g", "--graph", help="imprime o grafo de cena", action='store_true')
         parser.add_argument("-p", "--pause", help="começa simulação em pausa", action='store_true')
         parser.add_argument("-q", "--quiet", help="não exibe janela", action='store_true')
+        parser.add_argument("--no-cache", help="não usa o cache binário da cena", action='store_true')
+        parser.add_argument("--deferred", help="usa sombreamento adiado (G-buffer)", action='store_true')
+        parser.add_argument("--stats", help="imprime as estatísticas de descarte de cada quadro", action='store_true')
         args = parser.parse_args() # parse the arguments
         if args.input:
             self.x3d_file = args.input
@@ -176,8 +217,12 @@ class Renderizador:
         # Iniciando simulação de GPU
         gpu.GPU(self.image_file, path)
 
-        # Abre arquivo X3D
+        # Abre arquivo X3D (o grafo de cena precisa do XML, então não usa o cache)
         self.scene = x3d.X3D(self.x3d_file)
+        x3d.X3D.cache = not (args.no_cache or args.graph)
+        x3d.X3D.manter_xml = args.graph
+        gl.GL.deferred = args.deferred
+        gl.GL.mostra_estatisticas = args.stats
 
         # Iniciando Biblioteca Gráfica
         gl.GL.setup(
@@ -15,8 +15,20 @@ Data: 31 de Agosto de 2020
 import xml.etree.ElementTree
 
 # Outras
+import copy
 import re
 import math
+import os
+import pickle
+import hashlib
+import hmac
+import json
+
+# Numpy
+import numpy as np
+
+# Versão do leitor, faz parte da chave do cache binário (incrementar ao mudar os nós)
+LOADER_VERSION = 9
 
 # Métodos de Apoio
 
@@ -31,9 +43,13 @@ def get_colors(appearance):
         "emissiveColor": [0.0, 0.0, 0.0],  # Valor padrão
         "specularColor": [0.0, 0.0, 0.0],  # Valor padrão
         "shininess": 0.2,  # Valor padrão
-        "transparency": 0.0  # Valor padrão
+        "ambientIntensity": 0.2,  # Valor padrão
+        "transparency": 0.0,  # Valor padrão
+        "lighting": False  # sem Material a geometria não é iluminada
     }
     if appearance and appearance.material:
+        colors["lighting"] = True
+        colors["ambientIntensity"] = appearance.material.ambientIntensity
         colors["diffuseColor"] = appearance.material.diffuseColor
         colors["emissiveColor"] = appearance.material.emissiveColor
         colors["specularColor"] = appearance.material.specularColor
@@ -43,8 +59,134 @@ def get_colors(appearance):
     return colors
 
 
+def split_index(index):
+    """Separa uma lista de índices terminados em -1 em faixas (início, fim)."""
+    inicios, fins = index_ranges(index)
+    return list(zip(inicios.tolist(), fins.tolist()))
+
+def index_ranges(index):
+    """Vetores com o início e o fim de cada faixa não vazia de índices terminados em -1."""
+    index = np.asarray(index, dtype=np.int32)
+    fins = np.nonzero(np.append(index, -1) == -1)[0]
+    inicios = np.concatenate(([0], fins[:-1] + 1))
+    nao_vazias = fins > inicios
+    return inicios[nao_vazias], fins[nao_vazias]
+
+def strip_triangles(strip):
+    """Gera os triângulos de uma tira mantendo todos com a mesma orientação."""
+    strip = np.asarray(strip, dtype=np.int32)
+    t = np.arange(max(len(strip) - 2, 0))
+    triangles = np.column_stack((strip[t], strip[t + 1], strip[t + 2])).astype(np.int32)
+    triangles[1::2, :2] = triangles[1::2, 1::-1]  # nos ímpares troca os dois primeiros
+    return triangles.reshape(-1, 3)
+
+def face_triangles(coordIndex):
+    """Divide os polígonos terminados em -1 em leques de triângulos."""
+    # Retorna os triângulos e, para cada vértice deles, a posição correspondente em
+    # coordIndex, usada para acessar os campos paralelos colorIndex e texCoordIndex.
+    # Todos os leques são montados de uma vez: o polígono que começa em i com n vértices
+    # gera os triângulos (i, i+j, i+j+1) para j de 1 a n-2, com a mesma orientação da face.
+    inicios, fins = index_ranges(coordIndex)
+    quantidades = np.maximum(fins - inicios - 2, 0)
+    base = np.repeat(inicios, quantidades)
+    j = np.arange(quantidades.sum()) - np.repeat(np.cumsum(quantidades) - quantidades, quantidades) + 1
+    cantos = np.column_stack((base, base + j, base + j + 1)).astype(np.int32).reshape(-1, 3)
+    return np.asarray(coordIndex, dtype=np.int32)[cantos].reshape(-1, 3), cantos
+
+def mesh_normals(points, triangles, crease_angle, ccw=True):
+    """Normais dos cantos dos triângulos, suavizadas entre faces com ângulo até crease_angle."""
+    # Retorna uma tabela de normais (K, 3) float32 e, para cada canto dos triângulos, o
+    # índice (M, 3) da sua normal na tabela. Cada canto soma as normais (ponderadas pela
+    # área) dos triângulos do seu grupo: os que compartilham o vértice e estão a até
+    # crease_angle da semente do grupo.
+    # As normais apontam para o lado de onde os triângulos são vistos anti-horários (ccw).
+    pontos = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+    triangulos = np.asarray(triangles, dtype=np.int64).reshape(-1, 3)
+    v = pontos[triangulos]
+    faces = np.cross(v[:, 1] - v[:, 0], v[:, 2] - v[:, 0])
+    if not ccw:
+        faces = -faces
+    unitarias = faces / np.maximum(np.linalg.norm(faces, axis=1, keepdims=True), 1e-12)
+    if crease_angle <= 0 or len(triangulos) == 0:
+        indices = np.repeat(np.arange(len(triangulos)), 3).reshape(-1, 3)
+        return unitarias.astype(np.float32), indices.astype(np.int32)
+
+    # Cantos ordenados por vértice e agrupados por ângulo: a cada passo o primeiro canto
+    # pendente de cada vértice é a semente de um grupo e recebe os cantos pendentes do mesmo
+    # vértice a até crease_angle dele. Cada passo é linear no número de cantos e só se
+    # repete tantas vezes quanto o maior número de grupos de um vértice.
+    ordem = np.argsort(triangulos.reshape(-1), kind="stable")
+    vertices = triangulos.reshape(-1)[ordem]
+    face = ordem // 3
+    if crease_angle >= math.pi:
+        grupo = vertices
+    else:
+        grupo = np.empty(len(vertices), dtype=np.int64)
+        limite = math.cos(crease_angle)
+        pendentes = np.arange(len(vertices))
+        proximo = 0
+        while len(pendentes):
+            v = vertices[pendentes]
+            semente = np.ones(len(pendentes), dtype=bool)
+            semente[1:] = v[1:] != v[:-1]
+            rotulo = np.cumsum(semente) - 1
+            normal_semente = unitarias[face[pendentes[semente]]][rotulo]
+            juntar = (unitarias[face[pendentes]] * normal_semente).sum(axis=1) >= limite
+            juntar |= semente
+            grupo[pendentes[juntar]] = proximo + rotulo[juntar]
+            proximo += int(semente.sum())
+            pendentes = pendentes[~juntar]
+
+    soma = np.column_stack([np.bincount(grupo, weights=faces[face, k]) for k in range(3)])[grupo]
+    normais = np.empty_like(soma)
+    normais[ordem] = soma / np.maximum(np.linalg.norm(soma, axis=1, keepdims=True), 1e-12)
+    tabela, indices = np.unique(normais.astype(np.float32), axis=0, return_inverse=True)
+    return tabela, indices.reshape(-1, 3).astype(np.int32)
+
+# Caixa que não pode ser descartada, usada quando não se sabe o tamanho da geometria
+BBOX_INFINITA = (np.full(3, -np.inf), np.full(3, np.inf))
+
+def bbox_points(points):
+    """Caixa envolvente (mínimo, máximo) de uma lista de coordenadas x, y, z."""
+    pontos = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+    if len(pontos) == 0:
+        return None
+    return pontos.min(axis=0), pontos.max(axis=0)
+
+def bbox_union(caixas):
+    """União de caixas envolventes, onde None representa uma caixa vazia."""
+    caixas = [caixa for caixa in caixas if caixa is not None]
+    if not caixas:
+        return None
+    return np.min([caixa[0] for caixa in caixas], axis=0), np.max([caixa[1] for caixa in caixas], axis=0)
+
+def bbox_transform(caixa, matriz):
+    """Caixa alinhada aos eixos que envolve a caixa depois de transformada pela matriz."""
+    if caixa is None or not np.isfinite(caixa).all():
+        return caixa
+    centro = (caixa[0] + caixa[1]) / 2
+    meio = (caixa[1] - caixa[0]) / 2
+    centro = matriz[:3, :3] @ centro + matriz[:3, 3]
+    meio = np.abs(matriz[:3, :3]) @ meio
+    return centro - meio, centro + meio
+
+
 # Leitores de Campos X3D
 
+def numeric_field(node, field, default, dtype, componentes):
+    """Lê um campo MF numérico como matriz do NumPy (N,) ou (N, componentes)."""
+    # Vírgulas e espaços são separadores equivalentes, então basta o split do Python,
+    # bem mais rápido e compacto que converter valor a valor para listas de floats.
+    if node is not None and field in node.attrib:
+        valores = np.array(node.attrib[field].replace(',', ' ').split(), dtype=dtype)
+    elif default is None:
+        return None
+    else:
+        valores = np.asarray(default, dtype=dtype)
+    if componentes > 1:
+        return valores[:len(valores) // componentes * componentes].reshape(-1, componentes)
+    return valores
+
 def SFTime(node, field, default):
     """Especifica um único valor de tempo."""
     if node is not None and field in node.attrib:
@@ -58,24 +200,12 @@ def SFFloat(node, field, default):
     return default
 
 def MFFloat(node, field, default):
-    """Especifica uma cor."""
-    if node is not None and field in node.attrib:
-        val = node.attrib[field].strip()
-        if val:
-            val_str = re.split(r'[,\s]\s*', val)
-            return [float(value) for value in val_str]
-        return []
-    return default
+    """Especifica zero ou mais valores em ponto flutuante."""
+    return numeric_field(node, field, default, np.float32, 1)
 
 def MFInt32(node, field, default):
     """Especifica zero ou mais valores inteiros."""
-    if node is not None and field in node.attrib:
-        val = node.attrib[field].strip()
-        if val:
-            val_str = re.split(r'[,\s]\s*', val)
-            return [int(value) for value in val_str]
-        return []
-    return default
+    return numeric_field(node, field, default, np.int32, 1)
 
 def SFBool(node, field, default):
     """Especifica um único valor booleano."""
@@ -106,13 +236,7 @@ def SFColor(node, field, default):
 
 def MFColor(node, field, default):
     """Especifica uma cor."""
-    if node is not None and field in node.attrib:
-        val = node.attrib[field].strip()
-        if val:
-            val_str = re.split(r'[,\s]\s*', val)
-            return [float(value) for value in val_str]
-        return []
-    return default
+    return numeric_field(node, field, default, np.float32, 3)
 
 def SFVec3f(node, field, default):
     """Especifica um vetor tridimensional (3D)."""
@@ -126,23 +250,11 @@ def SFVec3f(node, field, default):
 
 def MFVec3f(node, field, default):
     """Especifica zero ou mais vetores tridimensionais (3D)."""
-    if node is not None and field in node.attrib:
-        val = node.attrib[field].strip()
-        if val:
-            val_str = re.split(r'[,\s]\s*', val)
-            return [float(value) for value in val_str]
-        return []
-    return default
+    return numeric_field(node, field, default, np.float32, 3)
 
 def MFVec2f(node, field, default):
     """Especifica zero ou mais vetores bidimensionais (2D)."""
-    if node is not None and field in node.attrib:
-        val = node.attrib[field].strip()
-        if val:
-            val_str = re.split(r'[,\s]\s*', val)
-            return [float(value) for value in val_str]
-        return []
-    return default
+    return numeric_field(node, field, default, np.float32, 2)
 
 def SFString(node, field, default):
     """Especifica uma strings."""
@@ -165,57 +277,81 @@ def MFNode(node, name, default):
         clean(child) # remove namespace
         if name == "X3DChildNode":
             if child.tag == "Shape":
-                children.append(Shape(child))
+                children.append(built_node(child, Shape))
             elif child.tag == "Transform":
-                children.append(Transform(child))
+                children.append(built_node(child, Transform))
 
     return children
 
+def built_node(child, classe):
+    """Reaproveita o nó já construído na leitura em fluxo ou constrói o nó agora."""
+    node = X3D.built_nodes.pop(child, None)
+    return node if node is not None else instance(child, classe)
+
+def instance(child, classe):
+    """Constrói o nó ou, se o elemento tiver USE, devolve o mesmo nó definido com DEF."""
+    if "USE" in child.attrib:
+        nome = child.attrib["USE"].strip()
+        if nome not in X3DNode.named_nodes:
+            raise Exception(f"USE para nó inexistente: {nome}")
+        return X3DNode.named_nodes[nome]
+    return classe(child)
+
 def SFNode(node, name, default):
     """Especifica um nó X3D."""
     for child in node:
         clean(child) # remove namespace
         if name == "X3DAppearanceNode":
             if child.tag == "Appearance":
-                appearance = Appearance(child)
+                appearance = instance(child, Appearance)
                 X3D.current_appearance = appearance
                 return appearance
         elif name == "X3DGeometryNode":
             if child.tag == "Polypoint2D":
-                return Polypoint2D(child)
+                return instance(child, Polypoint2D)
             if child.tag == "Polyline2D":
-                return Polyline2D(child)
+                return instance(child, Polyline2D)
             if child.tag == "Circle2D":
-                return Circle2D(child)
+                return instance(child, Circle2D)
             if child.tag == "TriangleSet2D":
-                return TriangleSet2D(child)
+                return instance(child, TriangleSet2D)
             if child.tag == "TriangleSet":
-                return TriangleSet(child)
+                return instance(child, TriangleSet)
             if child.tag == "TriangleStripSet":
-                return TriangleStripSet(child)
+                return instance(child, TriangleStripSet)
             if child.tag == "IndexedTriangleStripSet":
-                return IndexedTriangleStripSet(child)
+                return instance(child, IndexedTriangleStripSet)
             if child.tag == "Box":
-                return Box(child)
+                return instance(child, Box)
             if child.tag == "Sphere":
-                return Sphere(child)
+                return instance(child, Sphere)
+            if child.tag == "Cone":
+                return instance(child, Cone)
+            if child.tag == "Cylinder":
+                return instance(child, Cylinder)
             if child.tag == "IndexedFaceSet":
-                return IndexedFaceSet(child)
+                return instance(child, IndexedFaceSet)
         elif name == "X3DMaterialNode":
             if child.tag == "Material":
-                return Material(child)
+                return instance(child, Material)
         elif name == "X3DTextureNode":
             if child.tag == "ImageTexture":
-                return ImageTexture(child)
+                return instance(child, ImageTexture)
+        elif name == "TextureProperties":
+            if child.tag == "TextureProperties":
+                return instance(child, TextureProperties)
         elif name == "X3DCoordinateNode":
             if child.tag == "Coordinate":
-                return Coordinate(child)
+                return instance(child, Coordinate)
         elif name == "X3DColorNode":
             if child.tag == "Color":
-                return Color(child)
+                return instance(child, Color)
+        elif name == "X3DNormalNode":
+            if child.tag == "Normal":
+                return instance(child, Normal)
         elif name == "X3DTextureCoordinateNode":
             if child.tag == "TextureCoordinate":
-                return TextureCoordinate(child)
+                return instance(child, TextureCoordinate)
 
     return default
 
@@ -231,15 +367,16 @@ class X3D:
     Atributos
     ----------
     root : Element
-        raiz do grafo de cena X3D em XMl
+        raiz do grafo de cena X3D em XMl (esvaziada conforme a leitura em fluxo avança,
+        a não ser com manter_xml)
 
     current_color : {list[3]} (static)
         dicionário com as cores no formato RGB usadas no momento ["diffuseColor", "emissiveColor"]
         além dos valores de transparencia ["transparency"]
     current_appearance : X3DAppearanceNode (static)
         objeto de aparencia em X3D
-    current_texture = String (static)
-        URL das texturas
+    current_texture = TextureHandle (static)
+        referência para a textura atual no cache de texturas da GPU
 
     preview : interface (static)
          sistema de preview para geometrias 2D simples
@@ -259,12 +396,18 @@ class X3D:
     }
     current_appearance = None  # objeto de aparencia atual
     current_texture = []  # controle de texturas instantâneas
+    built_nodes = {}  # nós já construídos durante a leitura em fluxo, por elemento do XML
     preview = None  # atributo que aponta para o sistema de preview
     renderer = {}  # dicionario dos métodos de renderização
+    cache = True  # usa o cache binário da cena compilada
+    cache_dir = None  # pasta do cache (padrão: $XDG_CACHE_HOME/renderizador ou ~/.cache/renderizador)
+    listas_preview = ("pontos", "linhas", "circulos", "poligonos")
+    manter_xml = False  # lê o XML inteiro e o mantém em root (para imprimir o grafo de cena)
 
     def __init__(self, filename):
         """Constroi o atributo para a raiz do grafo X3D."""
-        self.root = xml.etree.ElementTree.parse(filename).getroot()
+        self.filename = filename
+        self.root = None  # Raiz do XML, preenchida (e esvaziada) durante o parse
         self.scene = None  # Referência para o objeto da cena
 
     def set_preview(self, preview):
@@ -277,11 +420,196 @@ class X3D:
         self.height = height
 
     def parse(self):
-        """Leitura da cena começando da raiz do X3D."""
-        for child in self.root:
-            clean(child) # remove namespace
-            if child.tag == "Scene":
-                self.scene = Scene(child)
+        """Carrega a cena do cache binário ou, se não houver, lê o XML e grava o cache."""
+        arquivo_cache = self.cache_file() if X3D.cache else None
+        if arquivo_cache and self.load_cache(arquivo_cache):
+            return
+        inicio = None
+        if X3D.preview:
+            inicio = {nome: len(getattr(X3D.preview, nome)) for nome in X3D.listas_preview}
+        self.parse_xml()
+        if arquivo_cache:
+            preview = None
+            if inicio is not None:
+                preview = {nome: getattr(X3D.preview, nome)[inicio[nome]:]
+                           for nome in X3D.listas_preview}
+            self.save_cache(arquivo_cache, preview)
+
+    def parse_xml(self):
+        """Leitura da cena em fluxo, construindo os nós conforme os elementos do XML fecham."""
+        # Cada Shape e Transform vira um nó X3D assim que seu elemento termina e o elemento
+        # é esvaziado logo em seguida, então o XML completo nunca fica todo na memória junto
+        # com a cena. Os nós prontos ficam em built_nodes até o pai reaproveitá-los. Só são
+        # construídos os elementos que a cena alcança (Transform no Scene ou em outro
+        # Transform, Shape em um Transform); os demais são lidos como no XML original.
+        if X3D.manter_xml:
+            self.root = xml.etree.ElementTree.parse(self.filename).getroot()
+            for child in self.root:
+                clean(child) # remove namespace
+                if child.tag == "Scene":
+                    self.scene = Scene(child)
+            return
+
+        X3D.built_nodes = {}
+        caminho = []  # tags dos elementos abertos, da raiz até o elemento atual
+        for evento, elemento in xml.etree.ElementTree.iterparse(self.filename,
+                                                                 events=("start", "end")):
+            if evento == "start":
+                clean(elemento) # remove namespace
+                if self.root is None:
+                    self.root = elemento
+                caminho.append(elemento.tag)
+                continue
+            caminho.pop()
+            if not X3D.alcancado(elemento.tag, caminho):
+                continue
+            if elemento.tag == "Shape":
+                X3D.built_nodes[elemento] = instance(elemento, Shape)
+                elemento.clear()
+            elif elemento.tag == "Transform":
+                X3D.built_nodes[elemento] = instance(elemento, Transform)
+                elemento.clear()
+            elif elemento.tag == "Scene":
+                self.scene = Scene(elemento)
+                elemento.clear()
+        X3D.built_nodes = {}
+
+    @staticmethod
+    def alcancado(tag, ancestrais):
+        """Verifica se o parse da cena chega ao elemento, dados os tags dos seus ancestrais."""
+        if len(ancestrais) < 1 or (len(ancestrais) > 1 and ancestrais[1] != "Scene"):
+            return False
+        if tag == "Scene":
+            return len(ancestrais) == 1
+        if not all(ancestral == "Transform" for ancestral in ancestrais[2:]):
+            return False
+        if tag == "Transform":
+            return len(ancestrais) >= 2
+        return tag == "Shape" and len(ancestrais) >= 3
+
+    def cache_file(self):
+        """Caminho do cache binário, indexado pelo hash do conteúdo e pela versão do leitor."""
+        resumo = hashlib.sha256()
+        with open(self.filename, "rb") as arquivo:
+            for bloco in iter(lambda: arquivo.read(1 << 20), b""):
+                resumo.update(bloco)
+        return os.path.join(X3D.pasta_cache(), f"{resumo.hexdigest()}.v{LOADER_VERSION}.x3dc")
+
+    @staticmethod
+    def pasta_cache():
+        """Pasta do cache, por usuário, fora do alcance de quem distribui as cenas."""
+        if X3D.cache_dir is not None:
+            return X3D.cache_dir
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+        return os.path.join(base, "renderizador")
+
+    @staticmethod
+    def chave_cache(criar=False):
+        """Chave secreta (guardada na pasta do cache) que assina os arquivos de cache."""
+        # Só quem tem a chave consegue gerar um cache aceito, então um arquivo forjado é
+        # descartado antes de qualquer unpickle. None se ainda não existe e criar é falso.
+        caminho = os.path.join(X3D.pasta_cache(), "chave")
+        if criar and not os.path.exists(caminho):
+            os.makedirs(X3D.pasta_cache(), mode=0o700, exist_ok=True)
+            try:
+                descritor = os.open(caminho, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+                with os.fdopen(descritor, "wb") as arquivo:
+                    arquivo.write(os.urandom(32))
+            except FileExistsError:
+                pass  # outro processo criou a chave ao mesmo tempo
+        try:
+            with open(caminho, "rb") as arquivo:
+                chave = arquivo.read()
+        except OSError:
+            return None
+        return chave if len(chave) == 32 else None
+
+    @staticmethod
+    def assinatura(chave, cabecalho, dados):
+        """HMAC-SHA256 do cabeçalho e do pickle do grafo."""
+        codigo = hmac.new(chave, len(cabecalho).to_bytes(8, "little"), hashlib.sha256)
+        codigo.update(cabecalho)
+        codigo.update(dados)
+        return codigo.digest()
+
+    @staticmethod
+    def inicio_buffers(tamanho):
+        """Posição (alinhada em 64 bytes) onde começam os arrays dentro do arquivo de cache."""
+        return -(-tamanho // 64) * 64
+
+    def save_cache(self, caminho, preview):
+        """Grava a cena compilada: pickle do grafo seguido dos arrays NumPy em bloco bruto."""
+        # Com o protocolo 5 os arrays saem do pickle como buffers separados, que são gravados
+        # alinhados no fim do arquivo para depois serem mapeados em memória sem cópia. O
+        # arquivo começa com o HMAC do cabeçalho (JSON) e do pickle, conferido na leitura.
+        buffers = []
+        dados = pickle.dumps({"scene": self.scene,
+                              "named_nodes": X3DNode.named_nodes,
+                              "preview": preview},
+                             protocol=5, buffer_callback=buffers.append)
+        regioes = []
+        posicao = 0
+        for buffer in buffers:
+            posicao = X3D.inicio_buffers(posicao)
+            regioes.append((posicao, buffer.raw().nbytes))
+            posicao += buffer.raw().nbytes
+        cabecalho = json.dumps({"versao": LOADER_VERSION, "tamanho": len(dados),
+                                "buffers": regioes}).encode()
+        base = X3D.inicio_buffers(40 + len(cabecalho) + len(dados))
+        temporario = f"{caminho}.{os.getpid()}.tmp"
+        try:
+            chave = X3D.chave_cache(criar=True)
+            if chave is None:
+                return
+            with open(temporario, "wb") as arquivo:
+                arquivo.write(X3D.assinatura(chave, cabecalho, dados))
+                arquivo.write(len(cabecalho).to_bytes(8, "little"))
+                arquivo.write(cabecalho)
+                arquivo.write(dados)
+                for (inicio, _), buffer in zip(regioes, buffers):
+                    arquivo.seek(base + inicio)
+                    arquivo.write(buffer.raw())
+            os.replace(temporario, caminho)  # troca atômica, outros processos nunca veem meio arquivo
+        except OSError:
+            # o cache é só uma otimização, sem permissão de escrita a cena segue normalmente
+            if os.path.exists(temporario):
+                os.remove(temporario)
+
+    def load_cache(self, caminho):
+        """Carrega a cena compilada do cache, mapeando os arrays NumPy direto do arquivo."""
+        chave = X3D.chave_cache()
+        if chave is None:
+            return False  # sem chave nenhum cache pode ser conferido
+        try:
+            with open(caminho, "rb") as arquivo:
+                assinatura = arquivo.read(32)
+                tamanho = int.from_bytes(arquivo.read(8), "little")
+                bruto = arquivo.read(tamanho)
+                cabecalho = json.loads(bruto)
+                dados = arquivo.read(cabecalho["tamanho"])
+            if not hmac.compare_digest(assinatura, X3D.assinatura(chave, bruto, dados)):
+                return False  # arquivo alterado ou gravado com outra chave, nunca faz unpickle
+            if cabecalho["versao"] != LOADER_VERSION:
+                return False
+            base = X3D.inicio_buffers(40 + tamanho + len(dados))
+            buffers = []
+            if cabecalho["buffers"]:
+                # modo "c" (copy-on-write): as páginas só são lidas do disco quando usadas
+                mapa = np.memmap(caminho, dtype=np.uint8, mode="c")
+                buffers = [mapa[base + inicio:base + inicio + nbytes]
+                           for inicio, nbytes in cabecalho["buffers"]]
+            compilado = pickle.loads(dados, buffers=buffers)
+        except (OSError, EOFError, ValueError, KeyError, TypeError, AttributeError,
+                pickle.UnpicklingError):
+            return False  # cache ausente, truncado ou de outra versão das classes
+        if X3D.preview and compilado["preview"] is None:
+            return False  # cache gravado sem o preview 2D, precisa ler o XML de novo
+        self.scene = compilado["scene"]
+        X3DNode.named_nodes.update(compilado["named_nodes"])
+        if X3D.preview:
+            for nome, itens in compilado["preview"].items():
+                getattr(X3D.preview, nome).extend(itens)
+        return True
 
     def render(self):
         """Renderização da cena começando da raiz do X3D."""
@@ -293,6 +621,8 @@ class Scene:
     def __init__(self, node):
         """Parse do nó X3D."""
         self.children = []
+        self.events = []  # sensores e interpoladores, avaliados antes do desenho
+        routes = []
         lights = []
         viewpoint = None
         navigation_info = None
@@ -301,15 +631,15 @@ class Scene:
         for child in node:
             clean(child)  # remove namespace
             if child.tag == "Transform":
-                self.children.append(Transform(child))
+                self.children.append(built_node(child, Transform))
             elif child.tag == "TimeSensor":
-                self.children.append(TimeSensor(child))
+                self.events.append(TimeSensor(child))
             elif child.tag == "SplinePositionInterpolator":
-                self.children.append(SplinePositionInterpolator(child))
+                self.events.append(SplinePositionInterpolator(child))
             elif child.tag == "OrientationInterpolator":
-                self.children.append(OrientationInterpolator(child))
+                self.events.append(OrientationInterpolator(child))
             elif child.tag == "ROUTE":
-                self.children.append(ROUTE(child))
+                routes.append(ROUTE(child))
             elif child.tag == "DirectionalLight":
                 lights.append(DirectionalLight(child))
             elif child.tag == "PointLight":
@@ -336,10 +666,117 @@ class Scene:
         if fog:  # garante que fog seja o último nó
             self.children.append(fog)
 
+        # Lista de desenho achatada, montada uma única vez a partir do grafo
+        self.draw_list = []
+        self.compile(self.children, None)
+
+        # Grafo de eventos, com as ROUTEs já resolvidas para os nós
+        self.event_order = self.compile_routes(routes)
+
+    def compile_routes(self, routes):
+        """Ordena topologicamente os nós ligados por ROUTEs (sensores, interpoladores, ...)."""
+        # Retorna a lista de (nó, se é avaliado, ROUTEs que saem dele), com todo nó depois
+        # dos que o alimentam, assim um evento atravessa a cadeia inteira no mesmo quadro.
+        # Cada ROUTE só propaga quando o valor do seu campo muda, mas a avaliação de um nó
+        # é do nó inteiro: qualquer campo de entrada alterado o faz ser recalculado.
+        nos = list(self.events)
+        avaliados = set(self.events)
+        saidas = {}
+        entradas = {}
+        for route in routes:
+            route.resolve()
+            for node in (route.source, route.target):
+                if node not in saidas:
+                    saidas[node] = []
+                    entradas[node] = 0
+                    if node not in nos:
+                        nos.append(node)
+            saidas[route.source].append(route)
+            entradas[route.target] += 1
+        for node in nos:
+            saidas.setdefault(node, [])
+            entradas.setdefault(node, 0)
+
+        # Algoritmo de Kahn, mantendo a ordem do arquivo entre nós independentes
+        ordem = []
+        prontos = [node for node in nos if entradas[node] == 0]
+        while prontos:
+            node = prontos.pop(0)
+            ordem.append(node)
+            for route in saidas[node]:
+                entradas[route.target] -= 1
+                if entradas[route.target] == 0:
+                    prontos.append(route.target)
+
+        # Ciclos não têm ordem válida; seus nós ficam no fim, na ordem do arquivo
+        ordem += [node for node in nos if node not in ordem]
+        return [(node, node in avaliados, saidas[node]) for node in ordem]
+
+    def compile(self, nodes, pai):
+        """Achata os nós na lista de desenho, na mesma ordem do percurso do grafo."""
+        for node in nodes:
+            entrada = DrawEntry(node, pai)
+            self.draw_list.append(entrada)
+            if isinstance(node, Transform):
+                self.compile(node.children, len(self.draw_list) - 1)
+                entrada.fim = len(self.draw_list)  # permite pular a subárvore inteira
+
     def render(self):
         """Rotina de renderização."""
-        for child in self.children:
-            child.render()
+        # Avalia os eventos do quadro antes de desenhar
+        for node, avaliar, routes in self.event_order:
+            if avaliar:
+                node.render()
+            for route in routes:
+                route.render()
+
+        if "Model_matrix" not in X3D.renderer:
+            for child in self.children:
+                child.render()
+            return
+
+        lista = self.draw_list
+        i = 0
+        while i < len(lista):
+            entrada = lista[i]
+            if entrada.pai is None:
+                mundo_pai, versao_pai = None, 0
+            else:
+                mundo_pai, versao_pai = lista[entrada.pai].mundo, lista[entrada.pai].versao
+            X3D.renderer["Model_matrix"](matrix=mundo_pai)
+
+            if isinstance(entrada.node, Transform):
+                # Se a caixa envolvente estiver fora da visão, pula a subárvore inteira
+                if "BoundingBox" in X3D.renderer:
+                    caixa = entrada.node.bounding_box()
+                    if caixa is not None and np.isfinite(caixa).all():
+                        if not X3D.renderer["BoundingBox"](bboxMin=caixa[0], bboxMax=caixa[1]):
+                            i = entrada.fim
+                            continue
+
+                # A matriz de mundo só é refeita se o Transform ou algum ancestral mudou
+                versoes = (entrada.node.versao, versao_pai)
+                if entrada.versoes != versoes:
+                    local = entrada.node.local_matrix()
+                    entrada.mundo = local if mundo_pai is None else mundo_pai @ local
+                    entrada.versoes = versoes
+                    entrada.versao += 1
+            else:
+                entrada.node.render()
+            i += 1
+
+
+class DrawEntry:
+    """Entrada da lista de desenho achatada gerada a partir do grafo de cena."""
+
+    def __init__(self, node, pai):
+        """Guarda o nó e a entrada do Transform que o contém."""
+        self.node = node
+        self.pai = pai        # índice da entrada do Transform pai, ou None na raiz
+        self.fim = None       # nos Transforms, índice logo após o fim da subárvore
+        self.mundo = None     # nos Transforms, matriz de mundo guardada
+        self.versoes = None   # versões do nó e do pai usadas para calcular a matriz de mundo
+        self.versao = 0       # incrementada sempre que a matriz de mundo muda
 
 # Core component
 
@@ -347,6 +784,9 @@ class X3DNode:
     """Nó abstrato que é o tipo base para todos os nós no sistema X3D."""
 
     named_nodes = {}  # Dicionário com todos os nós X3D nomeados
+    parents = ()  # nós que contêm este nó no grafo de cena (vários quando há USE)
+    bbox_valid = False  # se a caixa envolvente guardada ainda vale
+    versao = 0  # incrementada sempre que um campo do nó muda
 
     def __init__(self, node=None):
         """Parse do nó X3D."""
@@ -354,6 +794,39 @@ class X3DNode:
             self.name = node.attrib["DEF"].strip()
             X3DNode.named_nodes[self.name] = self
 
+    def bounding_box(self):
+        """Caixa envolvente (mínimo, máximo) do nó no sistema de coordenadas de quem o contém."""
+        if not self.bbox_valid:
+            self.bbox_cache = self.compute_bounding_box()
+            self.bbox_valid = True
+        return self.bbox_cache
+
+    def compute_bounding_box(self):
+        """Calcula a caixa envolvente do nó, None quando ele não desenha nada."""
+        return None
+
+    def set_field(self, field, value):
+        """Altera um campo do nó, descartando o que foi guardado a partir dele."""
+        setattr(self, field, value)
+        self.invalidate()
+
+    def add_parent(self, pai):
+        """Registra um nó que contém este nó."""
+        if pai not in self.parents:
+            self.parents = self.parents + (pai,)
+
+    def invalidate(self):
+        """Marca o nó como alterado e descarta as caixas envolventes dele e de quem o contém."""
+        self.versao += 1
+        pendentes = [self]
+        vistos = set()
+        while pendentes:
+            node = pendentes.pop()
+            if node not in vistos:
+                vistos.add(node)
+                node.bbox_valid = False
+                pendentes.extend(node.parents)
+
 class X3DChildNode(X3DNode):
     """Nó abstrato como base para campos children, addChildren, and removeChildren."""
 
@@ -421,6 +894,16 @@ class X3DGroupingNode(X3DChildNode):
         self.bboxSize = SFVec3f(node, "bboxSize", [-1, -1, -1])
         #   MFNode     [in]     addChildren               [X3DChildNode]
         #   MFNode     [in]     removeChildren            [X3DChildNode]
+        for child in self.children:
+            child.add_parent(self)
+
+    def compute_bounding_box(self):
+        """Usa a caixa informada no arquivo ou a união das caixas dos filhos."""
+        if list(self.bboxSize) != [-1, -1, -1]:
+            centro = np.asarray(self.bboxCenter, dtype=np.float64)
+            meio = np.asarray(self.bboxSize, dtype=np.float64) / 2
+            return centro - meio, centro + meio
+        return bbox_union(child.bounding_box() for child in self.children)
 
 
 class Transform(X3DGroupingNode):
@@ -434,12 +917,37 @@ class Transform(X3DGroupingNode):
         self.translation = SFVec3f(node, "translation", [0, 0, 0])
         self.center = SFVec3f(node, "center", [0, 0, 0])
         self.scaleOrientation = SFRotation(node, "scaleOrientation", [0, 0, 1, 0])
+        self.matriz_local = None
+        self.matriz_versao = -1  # versão do nó usada para calcular a matriz local
+
+    def local_matrix(self):
+        """Matriz local do Transform, recalculada só quando seus campos mudam."""
+        if self.matriz_versao != self.versao:
+            self.matriz_local = X3D.renderer["Transform_matrix"](translation=self.translation,
+                                                                 scale=self.scale,
+                                                                 rotation=self.rotation)
+            self.matriz_versao = self.versao
+        return self.matriz_local
+
+    def compute_bounding_box(self):
+        """Leva a caixa dos filhos para o sistema de coordenadas de quem contém o Transform."""
+        caixa = super().compute_bounding_box()
+        if "Transform_matrix" not in X3D.renderer:
+            return BBOX_INFINITA if caixa is not None else None
+        return bbox_transform(caixa, self.local_matrix())
 
     def render(self):
         """Rotina de renderização."""
         if not all(func in X3D.renderer for func in ("Transform_in", "Transform_out")):
             raise Exception("Transform(s) não foram implementados.")
 
+        # Se a caixa envolvente estiver fora da visão, a subárvore inteira é ignorada
+        if "BoundingBox" in X3D.renderer:
+            caixa = self.bounding_box()
+            if caixa is not None and np.isfinite(caixa).all():
+                if not X3D.renderer["BoundingBox"](bboxMin=caixa[0], bboxMax=caixa[1]):
+                    return
+
         # NO FUTURO MANDAR O OBJETO INTEIRO COM SEUS PARAMETROS ENCAPSULADOS
         X3D.renderer["Transform_in"](translation=self.translation,
                                      scale=self.scale,
@@ -461,6 +969,12 @@ class X3DShapeNode(X3DChildNode):
         super().__init__(node) # Chama construtor da classe pai
         self.appearance = SFNode(node, "X3DAppearanceNode", None)
         self.geometry = SFNode(node, "X3DGeometryNode", None)
+        if self.geometry:
+            self.geometry.add_parent(self)
+
+    def compute_bounding_box(self):
+        """A caixa envolvente do Shape é a da sua geometria."""
+        return self.geometry.bounding_box() if self.geometry else None
 
 class X3DAppearanceNode(X3DNode):
     """Este é o tipo de nó básico para todos os nós do tipo Appearance."""
@@ -534,10 +1048,41 @@ class ImageTexture(X3DTexture2DNode):
         self.url = MFString(node, "url", [])
         self.repeatS = SFBool(node, "repeatS", True)
         self.repeatT = SFBool(node, "repeatT", True)
+        self.textureProperties = SFNode(node, "TextureProperties", None)
+        self.handle = None  # referência para a textura no cache, resolvida uma única vez
 
     def render(self):
         """Rotina de renderização."""
-        X3D.current_texture = self.url
+        if "ImageTexture" not in X3D.renderer:
+            raise Exception("ImageTexture não foi implementado.")
+
+        if self.handle is None:
+            if self.textureProperties:
+                # TextureProperties substitui os modos de repetição do ImageTexture
+                props = self.textureProperties
+                self.handle = X3D.renderer["ImageTexture"](url=self.url,
+                                                           repeatS=props.boundaryModeS == "REPEAT",
+                                                           repeatT=props.boundaryModeT == "REPEAT",
+                                                           minificationFilter=props.minificationFilter,
+                                                           magnificationFilter=props.magnificationFilter,
+                                                           generateMipMaps=props.generateMipMaps)
+            else:
+                self.handle = X3D.renderer["ImageTexture"](url=self.url,
+                                                           repeatS=self.repeatS,
+                                                           repeatT=self.repeatT)
+        X3D.current_texture = self.handle
+
+class TextureProperties(X3DNode):
+    """Define os parâmetros de filtragem e de borda usados na amostragem de uma textura."""
+
+    def __init__(self, node):
+        """Parse do nó X3D."""
+        super().__init__(node) # Chama construtor da classe pai
+        self.boundaryModeS = SFString(node, "boundaryModeS", "REPEAT")
+        self.boundaryModeT = SFString(node, "boundaryModeT", "REPEAT")
+        self.generateMipMaps = SFBool(node, "generateMipMaps", False)
+        self.magnificationFilter = SFString(node, "magnificationFilter", "FASTEST")
+        self.minificationFilter = SFString(node, "minificationFilter", "FASTEST")
 
 class Appearance(X3DAppearanceNode):
     """Especifica as propriedades visuais da geometria."""
@@ -583,6 +1128,10 @@ class X3DGeometryNode(X3DNode):
         """Parse do nó X3D."""
         super().__init__(node)  # Chama construtor da classe pai
 
+    def compute_bounding_box(self):
+        """Sem saber o tamanho da geometria (como as 2D, em tela), ela nunca é descartada."""
+        return BBOX_INFINITA
+
 
 class X3DComposedGeometryNode(X3DGeometryNode):
     """Este é o tipo de nó base para toda a geometria 3D composta em X3D."""
@@ -599,6 +1148,33 @@ class X3DComposedGeometryNode(X3DGeometryNode):
         self.colorPerVertex = SFBool(node, "colorPerVertex", True)
         self.normalPerVertex = SFBool(node, "normalPerVertex", True)
         self.solid = SFBool(node, "solid", True)
+        if self.coord:
+            self.coord.add_parent(self)
+
+    def compute_bounding_box(self):
+        """Caixa envolvente das coordenadas dos vértices."""
+        return bbox_points(self.coord.point) if self.coord else None
+
+    def build_normals(self, triangles, crease_angle, cantos=None, faces=None, normalIndex=None):
+        """Normais da malha e seus índices por canto, montadas uma única vez na leitura."""
+        # Usa o nó Normal quando existe (com normalIndex, se houver, paralelo a coordIndex
+        # ou com uma entrada por face) e senão gera as normais a partir das coordenadas.
+        if self.normal and len(self.normal.vector):
+            if self.normalPerVertex:
+                indices = triangles
+                if normalIndex is not None and len(normalIndex):
+                    indices = normalIndex[cantos]
+            else:
+                indices = np.arange(len(triangles)) if faces is None else faces
+                if normalIndex is not None and len(normalIndex):
+                    indices = normalIndex[indices]
+                indices = np.repeat(indices[:, np.newaxis], 3, axis=1)
+            return self.normal.vector, np.asarray(indices, dtype=np.int32)
+        if not self.coord or not len(self.coord.point) or not len(triangles):
+            return None, None
+        if not self.normalPerVertex:
+            crease_angle = 0
+        return mesh_normals(self.coord.point, triangles, crease_angle, self.ccw)
 
 
 class X3DGeometricPropertyNode(X3DNode):
@@ -634,6 +1210,23 @@ class Coordinate(X3DCoordinateNode):
         self.point = MFVec3f(node, "point", [])
 
 
+class X3DNormalNode(X3DGeometricPropertyNode):
+    """Nó base para todos os tipos de nós de normais em X3D."""
+
+    def __init__(self, node=None):
+        """Parse do nó X3D."""
+        super().__init__(node)  # Chama construtor da classe pai
+
+
+class Normal(X3DNormalNode):
+    """Define um conjunto de vetores normais 3D para nós de geometria baseada em vértices."""
+
+    def __init__(self, node):
+        """Parse do nó X3D."""
+        super().__init__(node) # Chama construtor da classe pai
+        self.vector = MFVec3f(node, "vector", [])
+
+
 class Color(X3DColorNode):
     """Define um conjunto de cores RGB a serem usadas nos campos de outro nó."""
 
@@ -651,6 +1244,11 @@ class TriangleSet(X3DComposedGeometryNode):
         super().__init__(node) # Chama construtor da classe pai
         self.vertices = MFVec2f(node, "vertices", [])
 
+        # Normais geradas uma única vez (vértices não são compartilhados entre triângulos)
+        quantidade = len(self.coord.point) // 3 * 3 if self.coord else 0
+        self.normals, self.normal_triangles = self.build_normals(
+            np.arange(quantidade).reshape(-1, 3), math.pi)
+
         # Preview
         # Implemente se desejar
 
@@ -660,9 +1258,12 @@ class TriangleSet(X3DComposedGeometryNode):
             raise Exception("TriangleSet não foi implementado.")
 
         colors = get_colors(appearance)
-        if self.coord and self.coord.point:
+        if self.coord and len(self.coord.point):
             # NO FUTURO MANDAR O OBJETO INTEIRO COM SEUS PARAMETROS ENCAPSULADOS
-            X3D.renderer["TriangleSet"](point=self.coord.point, colors=colors)
+            X3D.renderer["TriangleSet"](point=self.coord.point, colors=colors,
+                                        solid=self.solid, ccw=self.ccw,
+                                        normals=self.normals,
+                                        normal_triangles=self.normal_triangles)
 
 class TriangleStripSet(X3DComposedGeometryNode):
     """Representa uma forma 3D composta por faixas de triângulos."""
@@ -672,6 +1273,13 @@ class TriangleStripSet(X3DComposedGeometryNode):
         super().__init__(node) # Chama construtor da classe pai
         self.stripCount = MFInt32(node, "stripCount", [])
 
+        # Triangulação feita uma única vez, já que a topologia não muda entre quadros
+        inicios = np.concatenate(([0], np.cumsum(self.stripCount)[:-1]))
+        strips = [strip_triangles(np.arange(inicio, inicio + n))
+                  for inicio, n in zip(inicios, self.stripCount)]
+        self.triangles = np.concatenate(strips) if strips else np.empty((0, 3), dtype=np.int32)
+        self.normals, self.normal_triangles = self.build_normals(self.triangles, math.pi)
+
         # Preview
         # Implemente se desejar
 
@@ -681,11 +1289,14 @@ class TriangleStripSet(X3DComposedGeometryNode):
             raise Exception("TriangleStripSet não foi implementado.")
 
         colors = get_colors(appearance)
-        if self.coord and self.coord.point and self.stripCount:
+        if self.coord and len(self.coord.point) and len(self.triangles):
             # NO FUTURO MANDAR O OBJETO INTEIRO COM SEUS PARAMETROS ENCAPSULADOS
             X3D.renderer["TriangleStripSet"](point=self.coord.point,
-                                             stripCount=self.stripCount,
-                                             colors=colors)
+                                             triangles=self.triangles,
+                                             colors=colors,
+                                             solid=self.solid, ccw=self.ccw,
+                                             normals=self.normals,
+                                             normal_triangles=self.normal_triangles)
 
 class IndexedTriangleStripSet(X3DComposedGeometryNode):
     """Representa uma forma 3D composta de tiras de triângulos."""
@@ -695,6 +1306,11 @@ class IndexedTriangleStripSet(X3DComposedGeometryNode):
         super().__init__(node) # Chama construtor da classe pai
         self.index = MFInt32(node, "index", [])
 
+        # Triangulação feita uma única vez, já que a topologia não muda entre quadros
+        strips = [strip_triangles(self.index[inicio:fim]) for inicio, fim in split_index(self.index)]
+        self.triangles = np.concatenate(strips) if strips else np.empty((0, 3), dtype=np.int32)
+        self.normals, self.normal_triangles = self.build_normals(self.triangles, math.pi)
+
         # Preview
         # Implemente se desejar
 
@@ -705,11 +1321,14 @@ class IndexedTriangleStripSet(X3DComposedGeometryNode):
 
         colors = get_colors(appearance)
         if "IndexedTriangleStripSet" in X3D.renderer:
-            if self.coord and self.coord.point and self.index:
+            if self.coord and len(self.coord.point) and len(self.triangles):
                 # NO FUTURO MANDAR O OBJETO INTEIRO COM SEUS PARAMETROS ENCAPSULADOS
                 X3D.renderer["IndexedTriangleStripSet"](point=self.coord.point,
-                                                        index=self.index,
-                                                        colors=colors)
+                                                        triangles=self.triangles,
+                                                        colors=colors,
+                                                        solid=self.solid, ccw=self.ccw,
+                                                        normals=self.normals,
+                                                        normal_triangles=self.normal_triangles)
 
 
 # Geometry2D component
@@ -724,9 +1343,7 @@ class Polypoint2D(X3DGeometryNode):
 
         # Preview
         if X3D.preview:
-            points = []
-            for i in range(0, len(self.point), 2):
-                points.append([self.point[i], self.point[i+1]])
+            points = self.point.tolist()
             X3D.preview.pontos.append({'appearance': X3D.current_appearance,
                                        'points': points})
 
@@ -736,7 +1353,7 @@ class Polypoint2D(X3DGeometryNode):
             raise Exception("Polypoint2D não foi implementado.")
 
         colors = get_colors(appearance)
-        if self.point:
+        if len(self.point):
             X3D.renderer["Polypoint2D"](point=self.point, colors=colors)
 
 
@@ -750,9 +1367,7 @@ class Polyline2D(X3DGeometryNode):
 
         # Preview
         if X3D.preview:
-            points = []
-            for i in range(0, len(self.lineSegments), 2):
-                points.append([self.lineSegments[i], self.lineSegments[i+1]])
+            points = self.lineSegments.tolist()
             X3D.preview.linhas.append({'appearance': X3D.current_appearance,
                                        'lines': points})
 
@@ -762,7 +1377,7 @@ class Polyline2D(X3DGeometryNode):
             raise Exception("Polyline2D não foi implementado.")
 
         colors = get_colors(appearance)
-        if self.lineSegments:
+        if len(self.lineSegments):
             X3D.renderer["Polyline2D"](lineSegments=self.lineSegments, colors=colors)
 
 
@@ -801,9 +1416,7 @@ class TriangleSet2D(X3DGeometryNode):
 
         # Preview
         if X3D.preview:
-            points = []
-            for i in range(0, len(self.vertices), 2):
-                points.append([self.vertices[i], self.vertices[i+1]])
+            points = self.vertices.tolist()
             X3D.preview.poligonos.append({'appearance': X3D.current_appearance,
                                           'vertices': points})
 
@@ -813,7 +1426,7 @@ class TriangleSet2D(X3DGeometryNode):
             raise Exception("TriangleSet2D não foi implementado.")
 
         colors = get_colors(appearance)
-        if self.vertices:
+        if len(self.vertices):
             X3D.renderer["TriangleSet2D"](vertices=self.vertices, colors=colors)
 
 
@@ -877,6 +1490,12 @@ class Box(X3DGeometryNode):
         """Parse do nó X3D."""
         super().__init__(node) # Chama construtor da classe pai
         self.size = SFVec3f(node, "size", [2, 2, 2])
+        self.solid = SFBool(node, "solid", True)
+
+    def compute_bounding_box(self):
+        """Caixa envolvente do paralelepípedo."""
+        meio = np.asarray(self.size, dtype=np.float64) / 2
+        return -meio, meio
 
     def render(self, appearance=None):
         """Rotina de renderização."""
@@ -885,7 +1504,7 @@ class Box(X3DGeometryNode):
 
         colors = get_colors(appearance)
         if self.size:
-            X3D.renderer["Box"](size=self.size, colors=colors)
+            X3D.renderer["Box"](size=self.size, colors=colors, solid=self.solid)
 
 
 class Sphere(X3DGeometryNode):
@@ -895,6 +1514,11 @@ class Sphere(X3DGeometryNode):
         """Parse do nó X3D."""
         super().__init__(node) # Chama construtor da classe pai
         self.radius = SFFloat(node, "radius", 1)
+        self.solid = SFBool(node, "solid", True)
+
+    def compute_bounding_box(self):
+        """Caixa envolvente da esfera."""
+        return np.full(3, -self.radius), np.full(3, self.radius)
 
     def render(self, appearance=None):
         """Rotina de renderização."""
@@ -903,7 +1527,66 @@ class Sphere(X3DGeometryNode):
 
         colors = get_colors(appearance)
         if self.radius:
-            X3D.renderer["Sphere"](radius=self.radius, colors=colors)
+            X3D.renderer["Sphere"](radius=self.radius, colors=colors, solid=self.solid)
+
+
+class Cone(X3DGeometryNode):
+    """Classe responsável por geometria Cone, centrado no (0,0,0) e alinhado com o eixo Y."""
+
+    def __init__(self, node):
+        """Parse do nó X3D."""
+        super().__init__(node) # Chama construtor da classe pai
+        self.bottomRadius = SFFloat(node, "bottomRadius", 1)
+        self.height = SFFloat(node, "height", 2)
+        self.side = SFBool(node, "side", True)
+        self.bottom = SFBool(node, "bottom", True)
+        self.solid = SFBool(node, "solid", True)
+
+    def compute_bounding_box(self):
+        """Caixa envolvente do cone."""
+        meio = np.array([self.bottomRadius, self.height / 2, self.bottomRadius])
+        return -meio, meio
+
+    def render(self, appearance=None):
+        """Rotina de renderização."""
+        if "Cone" not in X3D.renderer:
+            raise Exception("Cone não foi implementado.")
+
+        colors = get_colors(appearance)
+        if self.bottomRadius and self.height:
+            X3D.renderer["Cone"](bottomRadius=self.bottomRadius, height=self.height,
+                                 colors=colors, side=self.side, bottom=self.bottom,
+                                 solid=self.solid)
+
+
+class Cylinder(X3DGeometryNode):
+    """Classe responsável por geometria Cylinder, centrado no (0,0,0) e alinhado com o eixo Y."""
+
+    def __init__(self, node):
+        """Parse do nó X3D."""
+        super().__init__(node) # Chama construtor da classe pai
+        self.radius = SFFloat(node, "radius", 1)
+        self.height = SFFloat(node, "height", 2)
+        self.side = SFBool(node, "side", True)
+        self.bottom = SFBool(node, "bottom", True)
+        self.top = SFBool(node, "top", True)
+        self.solid = SFBool(node, "solid", True)
+
+    def compute_bounding_box(self):
+        """Caixa envolvente do cilindro."""
+        meio = np.array([self.radius, self.height / 2, self.radius])
+        return -meio, meio
+
+    def render(self, appearance=None):
+        """Rotina de renderização."""
+        if "Cylinder" not in X3D.renderer:
+            raise Exception("Cylinder não foi implementado.")
+
+        colors = get_colors(appearance)
+        if self.radius and self.height:
+            X3D.renderer["Cylinder"](radius=self.radius, height=self.height, colors=colors,
+                                     side=self.side, bottom=self.bottom, top=self.top,
+                                     solid=self.solid)
 
 
 class IndexedFaceSet(X3DComposedGeometryNode):
@@ -916,6 +1599,24 @@ class IndexedFaceSet(X3DComposedGeometryNode):
         self.coordIndex = MFInt32(node, "coordIndex", [])
         self.colorIndex = MFInt32(node, "colorIndex", [])
         self.texCoordIndex = MFInt32(node, "texCoordIndex", [])
+        self.normalIndex = MFInt32(node, "normalIndex", [])
+        self.creaseAngle = SFFloat(node, "creaseAngle", 0)
+
+        # Triangulação feita uma única vez, já que a topologia não muda entre quadros.
+        # Quando existem, colorIndex e texCoordIndex são paralelos ao coordIndex.
+        self.triangles, cantos = face_triangles(self.coordIndex)
+        self.color_triangles = None
+        if len(self.colorIndex):
+            self.color_triangles = self.colorIndex[cantos]
+        self.tex_triangles = None
+        if len(self.texCoordIndex):
+            self.tex_triangles = self.texCoordIndex[cantos]
+
+        # Normais também calculadas uma única vez
+        inicios, _ = index_ranges(self.coordIndex)
+        faces = np.searchsorted(inicios, cantos[:, 0], side="right") - 1
+        self.normals, self.normal_triangles = self.build_normals(
+            self.triangles, self.creaseAngle, cantos, faces, self.normalIndex)
 
     def render(self, appearance=None):
         """Rotina de renderização."""
@@ -935,13 +1636,17 @@ class IndexedFaceSet(X3DComposedGeometryNode):
 
         colors = get_colors(appearance)
 
-        if self.coordIndex:
-            X3D.renderer["IndexedFaceSet"](coord=ret_coord, coordIndex=self.coordIndex,
+        if len(self.triangles):
+            X3D.renderer["IndexedFaceSet"](coord=ret_coord, triangles=self.triangles,
                                            colorPerVertex=self.colorPerVertex, color=ret_color,
-                                           colorIndex=self.colorIndex, texCoord=ret_texCoord,
-                                           texCoordIndex=self.texCoordIndex,
+                                           color_triangles=self.color_triangles,
+                                           texCoord=ret_texCoord,
+                                           tex_triangles=self.tex_triangles,
                                            colors=colors,
-                                           current_texture=X3D.current_texture)
+                                           current_texture=X3D.current_texture,
+                                           solid=self.solid, ccw=self.ccw,
+                                           normals=self.normals,
+                                           normal_triangles=self.normal_triangles)
 
 
 # Lighting component
@@ -971,7 +1676,7 @@ class DirectionalLight(X3DLightNode):
         if "DirectionalLight" not in X3D.renderer:
             raise Exception("DirectionalLight não foi implementado.")
 
-        X3D.renderer["DirectionalLight"](ambientIntensity=self.ambientIntensity,
+        X3D.renderer["DirectionalLight"](on=self.on, ambientIntensity=self.ambientIntensity,
                                          color=self.color,
                                          intensity=self.intensity,
                                          direction=self.direction)
@@ -984,16 +1689,20 @@ class PointLight(X3DLightNode):
         """Parse do nó X3D."""
         super().__init__(node) # Chama construtor da classe pai
         self.location = SFVec3f(node, "location", [0.0, 0.0, 0.0])
+        self.radius = SFFloat(node, "radius", 100)
+        self.attenuation = SFVec3f(node, "attenuation", [1.0, 0.0, 0.0])
 
     def render(self):
         """Rotina de renderização."""
         if "PointLight" not in X3D.renderer:
             raise Exception("PointLight não foi implementado.")
 
-        X3D.renderer["PointLight"](ambientIntensity=self.ambientIntensity,
+        X3D.renderer["PointLight"](on=self.on, ambientIntensity=self.ambientIntensity,
                                    color=self.color,
                                    intensity=self.intensity,
-                                   location=self.location)
+                                   location=self.location,
+                                   radius=self.radius,
+                                   attenuation=self.attenuation)
 
 
 # Texturing component
@@ -1021,7 +1730,7 @@ class TextureCoordinate(X3DTextureCoordinateNode):
 # Environmental effects
 
 
-class X3DFogObject():
+class X3DFogObject(X3DNode):
     """Ttipo abstrato que descreve um nó que influencia a equação de iluminação de Fog."""
 
     def __init__(self, node):
@@ -1044,7 +1753,8 @@ class Fog(X3DBindableNode, X3DFogObject):
             raise Exception("Fog não foi implementado.")
 
         X3D.renderer["Fog"](visibilityRange=self.visibilityRange,
-                            color=self.color)
+                            color=self.color,
+                            fogType=self.fogType)
 
 class X3DInterpolatorNode(X3DChildNode):
     """Base para todos os tipos de interpoladores."""
@@ -1056,6 +1766,14 @@ class X3DInterpolatorNode(X3DChildNode):
         self.key = MFFloat(node, "key", [])  # MF<type>     [in,out] keyValue      []
         self.keyValue = MFFloat(node, "keyValue", None)
         self.value_changed = None  #   [S|M]F<type> [out]    value_changed
+        self.evaluated = -1  # versão do nó na última avaliação
+
+    def changed(self):
+        """Verifica se alguma entrada mudou desde a última avaliação, marcando como avaliado."""
+        if self.evaluated == self.versao:
+            return False
+        self.evaluated = self.versao
+        return True
 
 class SplinePositionInterpolator(X3DInterpolatorNode):
     """Interpola não linearmente entre uma lista de vetores 3D."""
@@ -1069,6 +1787,8 @@ class SplinePositionInterpolator(X3DInterpolatorNode):
         """Rotina de renderização."""
         if "SplinePositionInterpolator" not in X3D.renderer:
             raise Exception("SplinePositionInterpolator não foi implementado.")
+        if not self.changed():
+            return  # sem eventos novos, value_changed continua valendo
 
         self.value_changed = X3D.renderer["SplinePositionInterpolator"]\
             (set_fraction=self.set_fraction,
@@ -1087,13 +1807,15 @@ class OrientationInterpolator(X3DInterpolatorNode):
         """Rotina de renderização."""
         if "OrientationInterpolator" not in X3D.renderer:
             raise Exception("OrientationInterpolator não foi implementado.")
+        if not self.changed():
+            return  # sem eventos novos, value_changed continua valendo
 
         self.value_changed = X3D.renderer["OrientationInterpolator"](set_fraction=self.set_fraction,
                                                                      key=self.key,
                                                                      keyValue=self.keyValue)
 
 class ROUTE():
-    """."""
+    """Liga um campo de saída de um nó a um campo de entrada de outro nó."""
 
     def __init__(self, node):
         """Parse do nó X3D."""
@@ -1102,10 +1824,26 @@ class ROUTE():
         self.fromField = SFString(node, "fromField", '')
         self.toNode = SFString(node, "toNode", '')
         self.toField = SFString(node, "toField", '')
+        self.source = None  # nós resolvidos uma única vez, na leitura da cena
+        self.target = None
+        self.last_value = None  # último valor enviado, para só propagar mudanças
+        self.sent = False
+
+    def resolve(self):
+        """Troca os nomes dos nós pelos próprios nós."""
+        for nome in (self.fromNode, self.toNode):
+            if nome not in X3DNode.named_nodes:
+                raise Exception(f"ROUTE para nó inexistente: {nome}")
+        self.source = X3DNode.named_nodes[self.fromNode]
+        self.target = X3DNode.named_nodes[self.toNode]
 
     def render(self):
-        """Rotina de renderização."""
-        fromNode = X3DNode.named_nodes[self.fromNode]
-        value = getattr(fromNode, self.fromField)
-        toNode = X3DNode.named_nodes[self.toNode]
-        setattr(toNode, self.toField, value)
+        """Propaga o valor do campo de origem, se ele mudou desde o último envio."""
+        value = getattr(self.source, self.fromField)
+        if self.sent and value is not None and self.last_value is not None and \
+                np.array_equal(value, self.last_value):
+            return
+        # O set_field marca o nó de destino como alterado para os caches de desenho
+        self.target.set_field(self.toField, value)
+        self.last_value = copy.copy(value)
+        self.sent = True